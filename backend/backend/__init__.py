@@ -1 +1,8 @@
-from .main import app as app
+import time
+
+_started = time.perf_counter()
+
+from backend import startup  # noqa: E402
+from backend.main import app as app  # noqa: E402
+
+startup.record_import(time.perf_counter() - _started)
@@ -1,20 +1,169 @@
-from typing import Annotated
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import secrets
+import time
+from datetime import datetime
+from typing import Annotated, Literal
 
 from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from fastapi.security import (
+    HTTPAuthorizationCredentials,
+    HTTPBasic,
+    HTTPBasicCredentials,
+    HTTPBearer,
+)
 
+from backend.cache import MISSING, TTLCache
 from backend.models import Utilisateur
+from backend.settings import settings
 
-scheme = HTTPBasic()
+scheme = HTTPBasic(auto_error=False)
+bearer_scheme = HTTPBearer(auto_error=False)
 
+TypeJeton = Literal["access", "refresh"]
 
-async def get_current_user(
-    credentials: Annotated[HTTPBasicCredentials, Depends(scheme)],
-) -> Utilisateur:
-    user = await Utilisateur.get_or_none(email=credentials.username)
+# Jetons révoqués (identifiant -> expiration) et utilisateurs dont tous les jetons
+# émis avant une date donnée sont invalides. Les deux sont propres au processus.
+_revoked_tokens: dict[str, float] = {}
+_revoked_users: dict[int, float] = {}
+
+# Identifiants HTTP Basic déjà vérifiés (empreinte -> utilisateur) : la
+# limitation de débit, qui précède la route, compte ces requêtes pour leur
+# utilisateur sans avoir à vérifier le mot de passe
+verified_basic: TTLCache[str, int] = TTLCache(
+    "basic_auth",
+    maxsize=settings.BASIC_AUTH_CACHE_SIZE,
+    ttl=settings.BASIC_AUTH_CACHE_TTL,
+)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: str) -> str:
+    digest = hmac.new(
+        settings.SECRET_KEY.encode(), payload.encode("ascii"), hashlib.sha256
+    ).digest()
+    return _b64encode(digest)
+
+
+def _prune_revocations(now: float) -> None:
+    for jti, expiration in list(_revoked_tokens.items()):
+        if expiration < now:
+            del _revoked_tokens[jti]
+
+
+def create_token(user: Utilisateur, type_jeton: TypeJeton) -> str:
+    """Crée un jeton signé contenant de quoi reconstruire l'utilisateur."""
+    now = time.time()
+    ttl = (
+        settings.ACCESS_TOKEN_TTL
+        if type_jeton == "access"
+        else settings.REFRESH_TOKEN_TTL
+    )
+    claims = {
+        "sub": user.id,
+        "email": user.email,
+        "nom": user.nom,
+        "role": user.role.value,
+        "created": user.date_creation.isoformat(),
+        "typ": type_jeton,
+        "iat": now,
+        "exp": now + ttl,
+        "jti": secrets.token_urlsafe(12),
+    }
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{_sign(payload)}"
+
+
+def decode_token(token: str, type_jeton: TypeJeton) -> dict:
+    """Vérifie la signature, l'expiration et la révocation d'un jeton.
+
+    Lève une erreur HTTP 401 si le jeton n'est pas valide.
+    """
+    invalid = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    # Un jeton émis ne contient que des caractères ASCII ; les autres feraient
+    # échouer la signature et la comparaison avant toute vérification.
+    if not token.isascii():
+        raise invalid
+    payload, _, signature = token.partition(".")
+    if not hmac.compare_digest(signature, _sign(payload)):
+        raise invalid
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        raise invalid
+
+    now = time.time()
+    if claims.get("typ") != type_jeton or claims["exp"] < now:
+        raise invalid
+    if claims["jti"] in _revoked_tokens:
+        raise invalid
+    if claims["iat"] <= _revoked_users.get(claims["sub"], 0):
+        raise invalid
+    return claims
+
+
+def revoke_token(claims: dict) -> None:
+    """Révoque un jeton jusqu'à son expiration."""
+    now = time.time()
+    _prune_revocations(now)
+    _revoked_tokens[claims["jti"]] = claims["exp"]
+
+
+def revoke_user_tokens(user: Utilisateur) -> None:
+    """Invalide tous les jetons déjà émis pour un utilisateur."""
+    _revoked_users[user.id] = time.time()
+
+
+def user_from_claims(claims: dict) -> Utilisateur:
+    """Reconstruit l'utilisateur depuis le jeton, sans requête en base."""
+    return Utilisateur._init_from_db(
+        id=claims["sub"],
+        nom=claims["nom"],
+        email=claims["email"],
+        role=claims["role"],
+        date_creation=datetime.fromisoformat(claims["created"]),
+    )
+
+
+def _basic_fingerprint(username: str, password: str) -> str:
+    return hmac.new(
+        settings.SECRET_KEY.encode(),
+        f"{username}:{password}".encode(),
+        hashlib.sha256,
+    ).hexdigest()
+
+
+def verified_basic_user(credentials: str) -> int | None:
+    """Utilisateur des identifiants HTTP Basic encodés `credentials`, s'ils ont
+    déjà été vérifiés par une requête précédente, `None` sinon."""
+    try:
+        data = base64.b64decode(credentials).decode("ascii")
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        return None
+    username, _, password = data.partition(":")
+    user_id = verified_basic.get(_basic_fingerprint(username, password))
+    return None if user_id is MISSING else user_id
+
+
+async def authenticate(email: str, password: str) -> Utilisateur:
+    user = await Utilisateur.get_or_none(email=email)
     if not user:
         raise HTTPException(status_code=404, detail="Utilisateur introuvable")
-    if not user.verify_password(credentials.password):
+    if not await user.verify_password(password):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Mot de passe incorrect",
@@ -22,4 +171,24 @@ async def get_current_user(
     return user
 
 
+async def get_current_user(
+    bearer: Annotated[HTTPAuthorizationCredentials | None, Depends(bearer_scheme)],
+    credentials: Annotated[HTTPBasicCredentials | None, Depends(scheme)],
+) -> Utilisateur:
+    """Authentifie la requête par jeton, ou par HTTP Basic à défaut."""
+    if bearer:
+        return user_from_claims(decode_token(bearer.credentials, "access"))
+    if credentials:
+        user = await authenticate(credentials.username, credentials.password)
+        verified_basic.set(
+            _basic_fingerprint(credentials.username, credentials.password), user.id
+        )
+        return user
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Not authenticated",
+        headers={"WWW-Authenticate": "Basic"},
+    )
+
+
 CurrentUser = Annotated[Utilisateur, Depends(get_current_user)]
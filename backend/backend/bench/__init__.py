@@ -0,0 +1 @@
+"""Mesures de performance exécutées à la main, hors de l'application."""
@@ -0,0 +1,413 @@
+"""Banc de charge de l'API, exécuté dans le processus.
+
+L'application est démarrée contre la base de `DB_URL` (SQLite en mémoire,
+ou un MySQL local), la limitation de débit désactivée ; des utilisateurs,
+comptes et opérations sont créés, puis `--concurrency` clients enchaînent
+pendant `--duration` secondes un mélange de requêtes : connexion,
+consultation du tableau de bord, dépôts, virements et validation par un
+agent.
+
+Pour chaque route, le débit, les erreurs et les latences p50/p95/p99 sont
+affichés et écrits en JSON. Deux résultats se comparent avec `compare`, qui
+échoue si une route ralentit ou renvoie plus d'erreurs au-delà du seuil, ou
+si son débit ou le débit total baisse au-delà du seuil :
+
+    export DB_URL=sqlite://:memory:
+    python -m backend.bench.load run --output avant.json
+    python -m backend.bench.load run --output apres.json --baseline avant.json
+    python -m backend.bench.load compare avant.json apres.json --threshold 0.2
+"""
+
+import argparse
+import asyncio
+import dataclasses
+import json
+import math
+import random
+import subprocess
+import sys
+import time
+import typing
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import httpx
+
+from backend.main import app
+from backend.models import (
+    Compte,
+    Operation,
+    TypeCompte,
+    TypeOperation,
+    TypeUtilisateur,
+    Utilisateur,
+    ValidationCompte,
+)
+from backend.settings import settings
+
+PASSWORD = "bench"
+
+# Poids de chaque scénario dans le mélange de requêtes
+SCENARIOS = {
+    "login": 1,
+    "dashboard": 4,
+    "history": 3,
+    "recent": 2,
+    "depot": 2,
+    "virement": 2,
+    "validation": 1,
+}
+
+
+@dataclasses.dataclass
+class Sample:
+    route: str
+    status: int
+    duration: float
+
+
+@dataclasses.dataclass
+class Client:
+    email: str
+    token: str
+    account_id: int
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Percentile au rang le plus proche d'une liste triée."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+async def seed(users: int, operations: int) -> None:
+    """Crée (ou réutilise) les utilisateurs, leurs comptes et un historique."""
+    if not await Utilisateur.exists(email="agent@bench.local"):
+        await Utilisateur.create(
+            nom="agent",
+            email="agent@bench.local",
+            password=PASSWORD,
+            role=TypeUtilisateur.AGENT,
+        )
+    for index in range(users):
+        email = f"client{index}@bench.local"
+        if await Utilisateur.exists(email=email):
+            continue
+        user = await Utilisateur.create(
+            nom=f"client{index}", email=email, password=PASSWORD
+        )
+        compte = await Compte.create(
+            utilisateur=user, type_compte=TypeCompte.COURANT, solde=1_000_000
+        )
+        await ValidationCompte.create(compte=compte, valide=True)
+        await Operation.bulk_create(
+            [
+                Operation(
+                    type_operation=TypeOperation.DEPOT,
+                    compte_destination=compte,
+                    montant=10,
+                    processed=True,
+                )
+                for _ in range(operations)
+            ]
+        )
+
+
+class Bench:
+    def __init__(self, http, rng: random.Random):
+        self.http = http
+        self.rng = rng
+        self.samples: list[Sample] = []
+
+    async def request(
+        self, route: str, method: str, url: str, token: str | None = None, **kwargs
+    ):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        start = time.perf_counter()
+        response = await self.http.request(method, url, headers=headers, **kwargs)
+        self.samples.append(
+            Sample(route, response.status_code, time.perf_counter() - start)
+        )
+        return response
+
+    async def login(self, email: str) -> str:
+        response = await self.request(
+            "POST /api/auth/token",
+            "POST",
+            "/api/auth/token",
+            json={"email": email, "mot_de_passe": PASSWORD},
+        )
+        response.raise_for_status()
+        return response.json()["access_token"]
+
+    async def client(self, email: str) -> Client:
+        token = await self.login(email)
+        response = await self.http.get(
+            "/api/account", headers={"Authorization": f"Bearer {token}"}
+        )
+        response.raise_for_status()
+        return Client(email, token, response.json()[0]["account"]["id"])
+
+    async def scenario(
+        self, name: str, client: Client, clients: list[Client], agent: str
+    ) -> None:
+        account = client.account_id
+        if name == "login":
+            client.token = await self.login(client.email)
+        elif name == "dashboard":
+            await self.request("GET /api/account", "GET", "/api/account", client.token)
+        elif name == "history":
+            await self.request(
+                "GET /api/account/{account_id}",
+                "GET",
+                f"/api/account/{account}",
+                client.token,
+            )
+        elif name == "recent":
+            await self.request(
+                "GET /api/user/me/recent", "GET", "/api/user/me/recent", client.token
+            )
+        elif name == "depot":
+            await self.request(
+                "POST /api/transaction/{account_id}/depot",
+                "POST",
+                f"/api/transaction/{account}/depot",
+                client.token,
+                json={"montant": "10.00"},
+            )
+        elif name == "virement":
+            target = self.rng.choice(clients)
+            if target is client:
+                return
+            await self.request(
+                "POST /api/transaction/{account_id}/virement",
+                "POST",
+                f"/api/transaction/{account}/virement",
+                client.token,
+                json={"montant": "1.00", "target": target.account_id},
+            )
+        elif name == "validation":
+            response = await self.request(
+                "GET /api/transaction/tovalidate",
+                "GET",
+                "/api/transaction/tovalidate",
+                agent,
+            )
+            pending = response.json() if response.status_code == 200 else []
+            if pending:
+                operation = self.rng.choice(pending)
+                await self.request(
+                    "POST /api/transaction/validate/{id}",
+                    "POST",
+                    f"/api/transaction/validate/{operation['id']}",
+                    agent,
+                    json={"authorize": self.rng.random() < 0.9},
+                )
+
+    async def worker(
+        self, deadline: float, clients: list[Client], agent: str, index: int
+    ) -> None:
+        client = clients[index % len(clients)]
+        names = list(SCENARIOS)
+        weights = list(SCENARIOS.values())
+        while time.perf_counter() < deadline:
+            name = self.rng.choices(names, weights)[0]
+            await self.scenario(name, client, clients, agent)
+
+
+def summarize(samples: list[Sample], elapsed: float) -> dict[str, dict]:
+    by_route: dict[str, list[Sample]] = defaultdict(list)
+    for sample in samples:
+        by_route[sample.route].append(sample)
+
+    routes = {}
+    for route, route_samples in sorted(by_route.items()):
+        durations = sorted(sample.duration for sample in route_samples)
+        routes[route] = {
+            "requests": len(route_samples),
+            "errors": sum(sample.status >= 400 for sample in route_samples),
+            "throughput": len(route_samples) / elapsed,
+            "p50_ms": percentile(durations, 0.50) * 1000,
+            "p95_ms": percentile(durations, 0.95) * 1000,
+            "p99_ms": percentile(durations, 0.99) * 1000,
+        }
+    return routes
+
+
+def _commit() -> str | None:
+    result = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    return result.stdout.strip() or None
+
+
+async def run(args: argparse.Namespace) -> dict:
+    # Tous les clients virtuels partagent la même adresse
+    settings.RATE_LIMIT_ENABLED = False
+    rng = random.Random(args.seed)
+    async with app.router.lifespan_context(app):
+        await seed(args.users, args.operations)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as http:
+            bench = Bench(http, rng)
+            clients = [
+                await bench.client(f"client{index}@bench.local")
+                for index in range(args.users)
+            ]
+            agent = await bench.login("agent@bench.local")
+            bench.samples.clear()
+
+            start = time.perf_counter()
+            await asyncio.gather(
+                *(
+                    bench.worker(start + args.duration, clients, agent, index)
+                    for index in range(args.concurrency)
+                )
+            )
+            elapsed = time.perf_counter() - start
+
+    return {
+        "meta": {
+            "commit": _commit(),
+            "date": datetime.now(timezone.utc).isoformat(),
+            "db": settings.DB_URL.split("://")[0],
+            "duration": elapsed,
+            "concurrency": args.concurrency,
+            "users": args.users,
+            "operations": args.operations,
+            "seed": args.seed,
+        },
+        "total": {
+            "requests": len(bench.samples),
+            "throughput": len(bench.samples) / elapsed,
+        },
+        "routes": summarize(bench.samples, elapsed),
+    }
+
+
+def _error_rate(result: dict) -> float:
+    return result["errors"] / result["requests"] if result["requests"] else 0.0
+
+
+def _throughput_drop(
+    name: str, before: dict, after: dict, threshold: float
+) -> str | None:
+    if not before["throughput"]:
+        return None
+    ratio = 1 - after["throughput"] / before["throughput"]
+    if ratio <= threshold:
+        return None
+    return (
+        f"{name} : débit {before['throughput']:.1f} -> {after['throughput']:.1f}"
+        f" req/s (-{ratio:.0%})"
+    )
+
+
+def compare(baseline: dict, current: dict, threshold: float, metric: str) -> list[str]:
+    """Régressions de `current` par rapport à `baseline`.
+
+    Une route régresse si `metric` ou son taux d'erreurs augmente de plus de
+    `threshold` (0.2 = 20 %), ou si son débit baisse de plus de `threshold` ;
+    le débit total est comparé de même. Une route sans erreur dans la
+    référence n'en tolère aucune.
+    """
+    regressions = []
+    for route, result in current["routes"].items():
+        before = baseline["routes"].get(route)
+        if not before:
+            continue
+        if before[metric]:
+            ratio = result[metric] / before[metric] - 1
+            if ratio > threshold:
+                regressions.append(
+                    f"{route} : {metric} {before[metric]:.2f}"
+                    f" -> {result[metric]:.2f} (+{ratio:.0%})"
+                )
+        errors_before, errors = _error_rate(before), _error_rate(result)
+        if errors > errors_before * (1 + threshold):
+            regressions.append(f"{route} : erreurs {errors_before:.1%} -> {errors:.1%}")
+        if drop := _throughput_drop(route, before, result, threshold):
+            regressions.append(drop)
+    if drop := _throughput_drop(
+        "total", baseline["total"], current["total"], threshold
+    ):
+        regressions.append(drop)
+    return regressions
+
+
+def print_results(results: dict) -> None:
+    print(
+        f"{'route':<44} {'req':>6} {'err':>5} {'req/s':>8}"
+        f" {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    )
+    for route, result in results["routes"].items():
+        print(
+            f"{route:<44} {result['requests']:>6} {result['errors']:>5}"
+            f" {result['throughput']:>8.1f} {result['p50_ms']:>8.2f}"
+            f" {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f}"
+        )
+    total = results["total"]
+    print(f"total : {total['requests']} requêtes, {total['throughput']:.1f} req/s")
+
+
+def _load(path: str) -> dict:
+    with open(path) as file:
+        return json.load(file)
+
+
+def _check(
+    baseline: dict, current: dict, threshold: float, metric: str
+) -> typing.Literal[0, 1]:
+    regressions = compare(baseline, current, threshold, metric)
+    for regression in regressions:
+        print(f"RÉGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m backend.bench.load")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="lance le banc de charge")
+    run_parser.add_argument("--duration", type=float, default=10)
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--users", type=int, default=20)
+    run_parser.add_argument("--operations", type=int, default=200)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--output", help="fichier JSON des résultats")
+    run_parser.add_argument("--baseline", help="résultats JSON de référence")
+
+    compare_parser = commands.add_parser("compare", help="compare deux résultats")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+
+    for subparser in (run_parser, compare_parser):
+        subparser.add_argument("--threshold", type=float, default=0.2)
+        subparser.add_argument(
+            "--metric", choices=["p50_ms", "p95_ms", "p99_ms"], default="p95_ms"
+        )
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        return _check(
+            _load(args.baseline), _load(args.current), args.threshold, args.metric
+        )
+
+    results = asyncio.run(run(args))
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        return _check(_load(args.baseline), results, args.threshold, args.metric)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
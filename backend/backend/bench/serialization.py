@@ -0,0 +1,159 @@
+"""Compare la sérialisation des réponses : chemin FastAPI et `json_response`.
+
+Pour chaque réponse de liste, mesure le temps de sérialisation en octets :
+
+- `fastapi` : validation par le `response_model` de la route, conversion par
+  `jsonable_encoder`, puis `JSONResponse` (`json.dumps`) ;
+- `direct` : `backend.schemas.json_response`.
+
+Les objets sont construits en mémoire, sans base de données ; `DB_URL` doit
+tout de même être défini pour charger la configuration :
+
+    DB_URL=sqlite://:memory: python -m backend.bench.serialization --rows 1000
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import typing
+from datetime import timedelta
+from decimal import Decimal
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+from tortoise import Tortoise, timezone
+
+from backend.models import (
+    Compte,
+    Log,
+    Operation,
+    TypeCompte,
+    TypeOperation,
+    ValidationCompte,
+)
+from backend.routes.account import GetAccountResponse, ListAccountsResponse
+from backend.schemas import LogSchema, OperationSchema, dump_json
+
+
+def _operations(rows: int) -> list[Operation]:
+    now = timezone.now()
+    return [
+        Operation(
+            id=index,
+            type_operation=TypeOperation.VIREMENT,
+            compte_source_id=1,
+            compte_destination_id=2,
+            processed=bool(index % 2),
+            montant=Decimal("-12.34"),
+            date_creation=now - timedelta(seconds=index),
+        )
+        for index in range(rows)
+    ]
+
+
+def _compte(id: int) -> Compte:
+    return Compte(
+        id=id,
+        iban=f"FR76300060000112345678901{id:02d}",
+        utilisateur_id=1,
+        type_compte=TypeCompte.COURANT,
+        solde=Decimal("1234.56"),
+        solde_en_attente=Decimal("12.34"),
+        date_creation=timezone.now(),
+    )
+
+
+def _validation(id: int) -> ValidationCompte:
+    return ValidationCompte(
+        id=id, valide=True, compte_id=id, agent_id=None, date_validation=timezone.now()
+    )
+
+
+def cases(rows: int) -> dict[str, tuple[typing.Any, typing.Any]]:
+    """Réponses mesurées, par route : (type de réponse, contenu)."""
+    operations = _operations(rows)
+    now = timezone.now()
+    logs = [
+        Log(
+            id=index,
+            ip="127.0.0.1",
+            chemin="/api/account",
+            code_reponse=200,
+            date_creation=now,
+        )
+        for index in range(rows)
+    ]
+    return {
+        "GET /api/account/{account_id}": (
+            GetAccountResponse,
+            {
+                "account": _compte(1),
+                "operations": operations,
+                "validation": _validation(1),
+                "next_cursor": None,
+            },
+        ),
+        "GET /api/account": (
+            list[ListAccountsResponse],
+            [
+                {
+                    "account": _compte(id),
+                    "validation": _validation(id),
+                    "solde_disponible": Decimal("1222.22"),
+                }
+                for id in range(min(rows, 50))
+            ],
+        ),
+        "GET /api/user/me/recent": (
+            dict[str, list[OperationSchema]],
+            {f"FR{index:025d}": operations[:5] for index in range(min(rows, 50))},
+        ),
+        "GET /api/logs": (list[LogSchema], logs),
+    }
+
+
+async def _fastapi(route: APIRoute, content: typing.Any) -> bytes:
+    serialized = await serialize_response(
+        field=route.response_field, response_content=content
+    )
+    return bytes(JSONResponse(serialized).body)
+
+
+async def run(rows: int, repeat: int) -> None:
+    Tortoise.init_models(["backend.models"], "models")
+    print(f"{'route':<32} {'fastapi (ms)':>13} {'direct (ms)':>12} {'gain':>6}")
+    for name, (type_, content) in cases(rows).items():
+        route = APIRoute("/", endpoint=lambda: None, response_model=type_)
+        # Les deux chemins doivent produire le même JSON
+        assert await _fastapi(route, content) == dump_json(type_, content), name
+
+        legacy, direct = [], []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await _fastapi(route, content)
+            legacy.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            dump_json(type_, content)
+            direct.append(time.perf_counter() - start)
+
+        legacy_ms = statistics.median(legacy) * 1000
+        direct_ms = statistics.median(direct) * 1000
+        print(
+            f"{name:<32} {legacy_ms:>13.3f} {direct_ms:>12.3f}"
+            f" {legacy_ms / direct_ms:>5.1f}x"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0] if __doc__ else None
+    )
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
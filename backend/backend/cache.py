@@ -0,0 +1,61 @@
+"""Cache en mémoire, borné en taille et en durée de vie.
+
+Chaque entrée expire après `ttl` secondes ; au-delà de `maxsize` entrées, la
+moins récemment utilisée est supprimée. Le cache est propre au processus :
+les écritures d'un worker ne sont vues des autres qu'à l'expiration.
+"""
+
+import time
+import typing
+from collections import OrderedDict
+
+from backend import metrics
+
+MISSING: typing.Any = object()
+
+CACHE_REQUESTS = metrics.counter(
+    "cache_requests_total",
+    "Lectures dans les caches en mémoire, par cache et par résultat.",
+    ("cache", "outcome"),
+)
+
+
+class TTLCache[K, V]:
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        metrics.gauge(
+            f"cache_{name}_size",
+            f"Entrées du cache {name}.",
+            function=self.__len__,
+        )
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: K) -> V:
+        """Retourne la valeur en cache, ou `MISSING` si absente ou expirée."""
+        entry = self.entries.get(key)
+        if entry is not None:
+            expiration, value = entry
+            if expiration >= time.monotonic():
+                self.entries.move_to_end(key)
+                CACHE_REQUESTS.inc(cache=self.name, outcome="hit")
+                return value
+            del self.entries[key]
+        CACHE_REQUESTS.inc(cache=self.name, outcome="miss")
+        return MISSING
+
+    def set(self, key: K, value: V) -> None:
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key: K) -> None:
+        self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        self.entries.clear()
@@ -0,0 +1,155 @@
+"""Connexion à la base de données, et utilitaires partagés pour les requêtes
+SQL écrites à la main.
+
+Avec MySQL, la connexion utilise `PooledMySQLClient` : le pool aiomysql est
+dimensionné par les réglages `DB_POOL_*`, et l'attente d'une connexion libre
+est bornée par `DB_POOL_ACQUIRE_TIMEOUT` et mesurée, pour distinguer sous
+charge le temps passé dans MySQL de celui passé à attendre le pool.
+
+Si `DB_REPLICA_URL` est défini, les lectures des routes qui dépendent de
+`use_replica` sont envoyées au réplica (connexion `replica`) ; toutes les
+écritures, les lectures des autres routes et celles faites dans une
+transaction restent sur la base principale. L'en-tête `X-Stick-To-Primary`
+renvoie les lectures d'une requête vers la base principale, par exemple
+pour relire immédiatement une écriture.
+"""
+
+import asyncio
+import contextvars
+import time
+import typing
+
+from fastapi import Header, HTTPException, status
+from tortoise import BaseDBAsyncClient, Model, connections
+from tortoise.backends.base.client import TransactionalDBClient
+from tortoise.backends.base.config_generator import expand_db_url
+from tortoise.backends.mysql.client import MySQLClient
+
+from backend import metrics, monitoring
+from backend.settings import settings
+
+POOL_ACQUIRE_WAIT = metrics.histogram(
+    "db_pool_acquire_wait_seconds",
+    "Attente d'une connexion libre dans le pool de la base de données.",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+POOL_ACQUIRE_TIMEOUTS = metrics.counter(
+    "db_pool_acquire_timeouts_total",
+    "Attentes d'une connexion abandonnées après `DB_POOL_ACQUIRE_TIMEOUT`.",
+)
+POOL_WAITING = metrics.gauge(
+    "db_pool_waiting", "Tâches en attente d'une connexion du pool."
+)
+
+
+def placeholder(db: BaseDBAsyncClient) -> str:
+    """Marqueur de paramètre du pilote utilisé par la connexion."""
+    return "?" if db.capabilities.dialect == "sqlite" else "%s"
+
+
+class TimedPool:
+    """Pool aiomysql dont l'attente d'une connexion est bornée et mesurée.
+
+    Les autres attributs sont ceux du pool enveloppé.
+    """
+
+    def __init__(self, pool: typing.Any, acquire_timeout: float):
+        self._pool = pool
+        self.acquire_timeout = acquire_timeout
+
+    def __getattr__(self, name: str) -> typing.Any:
+        return getattr(self._pool, name)
+
+    async def acquire(self) -> typing.Any:
+        start = time.perf_counter()
+        POOL_WAITING.inc()
+        try:
+            async with asyncio.timeout(self.acquire_timeout):
+                return await self._pool.acquire()
+        except TimeoutError:
+            POOL_ACQUIRE_TIMEOUTS.inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Database connection pool exhausted",
+                headers={"Retry-After": "1"},
+            )
+        finally:
+            POOL_WAITING.dec()
+            wait = time.perf_counter() - start
+            POOL_ACQUIRE_WAIT.observe(wait)
+            monitoring.record_pool_wait(wait)
+
+
+class PooledMySQLClient(MySQLClient):
+    def __init__(self, *, acquire_timeout: float, **kwargs: typing.Any):
+        super().__init__(**kwargs)
+        self.acquire_timeout = acquire_timeout
+
+    async def create_connection(self, with_db: bool) -> None:
+        await super().create_connection(with_db)
+        self._pool = TimedPool(self._pool, self.acquire_timeout)
+
+
+# Lu par Tortoise pour le moteur `backend.db`
+client_class = PooledMySQLClient
+
+
+# Vrai pendant une requête dont les lectures peuvent aller au réplica
+_read_replica: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "read_replica", default=False
+)
+
+
+async def use_replica(
+    x_stick_to_primary: typing.Annotated[bool, Header()] = False,
+) -> typing.AsyncIterator[None]:
+    """Dépendance des routes en lecture seule : leurs lectures vont au réplica,
+    sauf si la requête demande la base principale."""
+    token = _read_replica.set(not x_stick_to_primary)
+    try:
+        yield
+    finally:
+        _read_replica.reset(token)
+
+
+class ReplicaRouter:
+    """Routeur Tortoise : lectures vers `replica` pendant `use_replica`."""
+
+    def db_for_read(self, model: type[Model]) -> str | None:
+        if not _read_replica.get():
+            return None
+        # Une transaction en cours doit lire ses propres écritures
+        if isinstance(connections.get("default"), TransactionalDBClient):
+            return None
+        return "replica"
+
+    def db_for_write(self, model: type[Model]) -> str | None:
+        return None
+
+
+def _connection(url: str) -> dict[str, typing.Any]:
+    connection = expand_db_url(url)
+    if connection["engine"] == "tortoise.backends.mysql":
+        connection["engine"] = __name__
+        connection["credentials"].update(
+            minsize=settings.DB_POOL_MINSIZE,
+            maxsize=settings.DB_POOL_MAXSIZE,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            acquire_timeout=settings.DB_POOL_ACQUIRE_TIMEOUT,
+        )
+    return connection
+
+
+def tortoise_config() -> dict[str, typing.Any]:
+    """Configuration Tortoise construite à partir de `DB_URL`, `DB_REPLICA_URL`
+    et des réglages du pool, qui l'emportent sur les paramètres des URL."""
+    config: dict[str, typing.Any] = {
+        "connections": {"default": _connection(settings.DB_URL)},
+        "apps": {
+            "models": {"models": ["backend.models"], "default_connection": "default"}
+        },
+    }
+    if settings.DB_REPLICA_URL:
+        config["connections"]["replica"] = _connection(settings.DB_REPLICA_URL)
+        config["routers"] = [ReplicaRouter]
+    return config
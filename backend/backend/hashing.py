@@ -0,0 +1,113 @@
+"""Hachage des mots de passe hors de la boucle d'événements.
+
+`sha256_crypt` coûte plusieurs dizaines de millisecondes de CPU par appel :
+exécuté directement dans un handler, il bloque toutes les autres requêtes.
+Les calculs sont donc confiés à un pool borné, et l'attente pour y accéder
+est mesurée.
+"""
+
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from passlib.hash import sha256_crypt
+
+from backend import metrics
+from backend.settings import settings
+
+HASH_IN_FLIGHT = metrics.gauge(
+    "password_hash_in_flight", "Hachages en cours d'exécution dans le pool."
+)
+HASH_WAITING = metrics.gauge(
+    "password_hash_waiting", "Hachages en attente d'une place dans le pool."
+)
+HASH_QUEUE_WAIT = metrics.histogram(
+    "password_hash_queue_wait_seconds",
+    "Temps d'attente avant l'exécution d'un hachage.",
+    ("operation",),
+)
+HASH_DURATION = metrics.histogram(
+    "password_hash_duration_seconds",
+    "Durée d'exécution d'un hachage dans le pool.",
+    ("operation",),
+)
+
+_executor: Executor | None = None
+_slots: asyncio.Semaphore | None = None
+
+
+def _hash(password: str) -> str:
+    return sha256_crypt.hash(password)
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return sha256_crypt.verify(password, hashed)
+
+
+def _noop() -> None:
+    pass
+
+
+def _get_executor() -> tuple[Executor, asyncio.Semaphore]:
+    global _executor, _slots
+    if _executor is None or _slots is None:
+        if settings.HASH_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=settings.HASH_POOL_SIZE)
+        else:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.HASH_POOL_SIZE, thread_name_prefix="hash"
+            )
+        _slots = asyncio.Semaphore(settings.HASH_POOL_SIZE)
+    return _executor, _slots
+
+
+async def _run(operation: str, function, *args):
+    executor, slots = _get_executor()
+    queued = time.perf_counter()
+    HASH_WAITING.inc()
+    try:
+        await slots.acquire()
+    finally:
+        HASH_WAITING.dec()
+    started = time.perf_counter()
+    HASH_QUEUE_WAIT.observe(started - queued, operation=operation)
+    HASH_IN_FLIGHT.inc()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, function, *args
+        )
+    finally:
+        HASH_IN_FLIGHT.dec()
+        HASH_DURATION.observe(time.perf_counter() - started, operation=operation)
+        slots.release()
+
+
+async def hash_password(password: str) -> str:
+    """Hache un mot de passe en clair sans bloquer la boucle d'événements."""
+    return await _run("hash", _hash, password)
+
+
+async def check_password(password: str, hashed: str) -> bool:
+    """Vérifie un mot de passe en clair sans bloquer la boucle d'événements."""
+    return await _run("verify", _verify, password, hashed)
+
+
+async def warm_up() -> None:
+    """Démarre les workers du pool avant le premier hachage.
+
+    Un pool de processus ne crée ses processus qu'au fil des tâches : sans
+    cela, les premières connexions paieraient leur démarrage.
+    """
+    executor, _ = _get_executor()
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(
+        *(loop.run_in_executor(executor, _noop) for _ in range(settings.HASH_POOL_SIZE))
+    )
+
+
+def shutdown() -> None:
+    """Arrête le pool de hachage, appelé à l'arrêt de l'application."""
+    global _executor, _slots
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = _slots = None
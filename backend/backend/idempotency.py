@@ -0,0 +1,229 @@
+"""Clés d'idempotence (`Idempotency-Key`) des routes de création.
+
+Quand une requête `POST` porte l'en-tête `Idempotency-Key`, sa réponse est
+conservée en mémoire pendant `IDEMPOTENCY_TTL` secondes. Une nouvelle requête
+avec la même clé reçoit la réponse enregistrée, sans exécuter la route. Si la
+première requête est encore en cours, les suivantes attendent sa réponse au
+lieu de l'exécuter une seconde fois. Au-delà de `IDEMPOTENCY_MAX_KEYS` clés,
+les plus anciennes réponses enregistrées sont oubliées.
+
+La clé est propre à l'utilisateur authentifié : un autre client ne peut pas
+relire une réponse avec la même clé, et un client qui renouvelle son jeton
+d'accès entre deux essais retrouve la sienne. Les identifiants sont donc
+vérifiés avant de chercher la réponse, ce qui refuse aussi un jeton révoqué
+depuis. Comme les jetons révoqués, les réponses enregistrées sont propres au
+processus.
+
+L'empreinte de la requête, comparée à celle de la requête enregistrée,
+couvre la méthode, le chemin, les paramètres et le corps. Les corps lus au
+fil de l'eau par la route (`STREAMED_CONTENT_TYPES`) n'en font pas partie,
+pour ne pas être mis en mémoire en entier : la clé seule les identifie.
+"""
+
+import asyncio
+import dataclasses
+import hashlib
+import time
+import typing
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request, Response, status
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+
+from backend import metrics
+from backend.auth import bearer_scheme, get_current_user, scheme
+from backend.models import Utilisateur
+from backend.settings import settings
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+STREAMED_CONTENT_TYPES = frozenset({"application/x-ndjson"})
+
+IDEMPOTENT_REQUESTS = metrics.counter(
+    "idempotent_requests_total",
+    "Requêtes portant une clé d'idempotence, par devenir.",
+    ("outcome",),
+)
+
+
+@dataclasses.dataclass
+class Entry:
+    fingerprint: str
+    expiration: float
+    # Résolu avec la réponse, ou `None` si la requête a échoué sans réponse
+    # à rejouer : la clé peut alors être réutilisée.
+    response: asyncio.Future[Response | None]
+
+
+class IdempotencyStore:
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # Par ordre de réservation de la clé
+        self.entries: OrderedDict[str, Entry] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> Entry | None:
+        entry = self.entries.get(key)
+        if (
+            entry is not None
+            and entry.response.done()
+            and entry.expiration < time.monotonic()
+        ):
+            del self.entries[key]
+            return None
+        return entry
+
+    def claim(self, key: str, fingerprint: str) -> Entry:
+        entry = Entry(
+            fingerprint=fingerprint,
+            expiration=time.monotonic() + self.ttl,
+            response=asyncio.get_running_loop().create_future(),
+        )
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        self._evict()
+        return entry
+
+    def _evict(self) -> None:
+        """Oublie les plus anciennes réponses au-delà de `maxsize` clés.
+
+        Les requêtes encore en cours sont conservées : d'autres peuvent
+        attendre leur réponse.
+        """
+        excess = len(self.entries) - self.maxsize
+        evicted: list[str] = []
+        for key, entry in self.entries.items():
+            if len(evicted) >= excess:
+                break
+            if entry.response.done():
+                evicted.append(key)
+        for key in evicted:
+            del self.entries[key]
+
+    def release(self, key: str, entry: Entry) -> None:
+        """Libère la clé d'une requête qui n'a pas produit de réponse à rejouer."""
+        if self.entries.get(key) is entry:
+            del self.entries[key]
+        if not entry.response.done():
+            entry.response.set_result(None)
+
+    async def expire(self) -> None:
+        """Supprime les réponses enregistrées dont la durée de vie est écoulée."""
+        now = time.monotonic()
+        for key, entry in list(self.entries.items()):
+            if entry.expiration < now and entry.response.done():
+                del self.entries[key]
+
+
+store = IdempotencyStore(
+    ttl=settings.IDEMPOTENCY_TTL, maxsize=settings.IDEMPOTENCY_MAX_KEYS
+)
+
+metrics.gauge(
+    "idempotency_keys",
+    "Clés d'idempotence conservées en mémoire.",
+    function=store.__len__,
+)
+
+
+async def _fingerprint(request: Request) -> str:
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.url.path.encode())
+    digest.update(b"?")
+    digest.update(request.url.query.encode())
+    digest.update(b"\0")
+    content_type = request.headers.get("Content-Type", "").partition(";")[0]
+    if content_type.strip() in STREAMED_CONTENT_TYPES:
+        digest.update(content_type.strip().encode())
+    else:
+        digest.update(await request.body())
+    return digest.hexdigest()
+
+
+async def _authenticate(request: Request) -> Utilisateur:
+    """Vérifie les identifiants de la requête comme la route le ferait."""
+    return await get_current_user(await bearer_scheme(request), await scheme(request))
+
+
+def _replay(response: Response) -> Response:
+    headers = dict(response.headers)
+    headers["Idempotent-Replayed"] = "true"
+    return Response(
+        content=response.body, status_code=response.status_code, headers=headers
+    )
+
+
+def _error_response(exception: HTTPException) -> Response:
+    return JSONResponse(
+        {"detail": exception.detail},
+        status_code=exception.status_code,
+        headers=exception.headers,
+    )
+
+
+class IdempotentRoute(APIRoute):
+    """Route dont les requêtes `POST` acceptent l'en-tête `Idempotency-Key`.
+
+    Les réponses et les erreurs HTTP 4xx sont enregistrées ; les erreurs
+    serveur ne le sont pas, pour que le client puisse réessayer.
+    """
+
+    def get_route_handler(
+        self,
+    ) -> typing.Callable[[Request], typing.Coroutine[typing.Any, typing.Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def idempotent_handler(request: Request) -> Response:
+            idempotency_key = request.headers.get(HEADER)
+            if request.method != "POST" or idempotency_key is None:
+                return await handler(request)
+            if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid Idempotency-Key header",
+                )
+
+            user = await _authenticate(request)
+            key = f"{user.id}:{idempotency_key}"
+            fingerprint = await _fingerprint(request)
+
+            while (entry := store.get(key)) is not None:
+                if entry.fingerprint != fingerprint:
+                    IDEMPOTENT_REQUESTS.inc(outcome="conflict")
+                    raise HTTPException(
+                        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                        detail="Idempotency-Key already used for another request",
+                    )
+                if not entry.response.done():
+                    IDEMPOTENT_REQUESTS.inc(outcome="waited")
+                response = await asyncio.shield(entry.response)
+                if response is not None:
+                    IDEMPOTENT_REQUESTS.inc(outcome="replayed")
+                    return _replay(response)
+                # La première requête a échoué : celle-ci prend la clé
+
+            entry = store.claim(key, fingerprint)
+            try:
+                response = await handler(request)
+            except HTTPException as exception:
+                if exception.status_code >= 500:
+                    store.release(key, entry)
+                    raise
+                response = _error_response(exception)
+            except BaseException:
+                store.release(key, entry)
+                raise
+
+            if response.status_code >= 500 or not hasattr(response, "body"):
+                store.release(key, entry)
+            else:
+                IDEMPOTENT_REQUESTS.inc(outcome="stored")
+                entry.response.set_result(response)
+            return response
+
+        return idempotent_handler
@@ -0,0 +1,183 @@
+"""Écriture différée et rétention du journal des requêtes.
+
+Le middleware ne fait qu'ajouter l'entrée dans une file bornée ; une tâche de
+fond les insère par lots avec `bulk_create`, dès que le lot est plein ou que
+le délai de vidage est écoulé.
+
+Passé la durée de rétention, les entrées sont regroupées dans `LogStatistique`
+puis supprimées, pour que la table `Log` ne grossisse pas indéfiniment.
+"""
+
+import asyncio
+import logging
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+
+from tortoise import timezone
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+
+from backend import metrics
+from backend.models import Log, LogStatistique
+from backend.settings import settings
+
+logger = logging.getLogger(__name__)
+
+LOG_ENTRIES = metrics.counter(
+    "request_log_entries_total",
+    "Entrées du journal des requêtes, par devenir.",
+    ("outcome",),
+)
+
+
+class LogWriter:
+    """File d'attente bornée vidée en tâche de fond par insertions groupées."""
+
+    def __init__(self, queue_size: int, batch_size: int, flush_interval: float):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: asyncio.Queue[Log] | None = None
+        self._batch: list[Log] = []
+        self._task: asyncio.Task | None = None
+
+    def qsize(self) -> int:
+        return self.queue.qsize() if self.queue is not None else 0
+
+    def submit(self, ip: str | None, chemin: str, code_reponse: int) -> None:
+        """Ajoute une entrée sans attendre ; elle est perdue si la file est pleine."""
+        if chemin in settings.LOG_EXCLUDED_PATHS:
+            LOG_ENTRIES.inc(outcome="excluded")
+            return
+        if random.random() >= settings.LOG_SAMPLE_RATE:
+            LOG_ENTRIES.inc(outcome="sampled_out")
+            return
+        if self.queue is None:
+            LOG_ENTRIES.inc(outcome="dropped")
+            return
+        entry = Log(
+            ip=ip,
+            chemin=chemin,
+            code_reponse=code_reponse,
+            date_creation=timezone.now(),
+        )
+        try:
+            self.queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            LOG_ENTRIES.inc(outcome="dropped")
+        else:
+            LOG_ENTRIES.inc(outcome="queued")
+
+    def start(self) -> None:
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Arrête la tâche de fond et écrit tout ce qui reste en file."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.queue is not None:
+            while not self.queue.empty():
+                self._batch.append(self.queue.get_nowait())
+            self.queue = None
+        await self._flush()
+
+    async def _run(self) -> None:
+        assert self.queue is not None
+        queue = self.queue
+        loop = asyncio.get_running_loop()
+        while True:
+            self._batch.append(await queue.get())
+            deadline = loop.time() + self.flush_interval
+            while len(self._batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(queue.get(), timeout)
+                except TimeoutError:
+                    break
+                self._batch.append(entry)
+            await self._flush()
+
+    async def _flush(self) -> None:
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+        try:
+            await Log.bulk_create(batch)
+        except asyncio.CancelledError:
+            # Arrêt en cours : le lot sera réécrit par `stop`
+            self._batch = batch + self._batch
+            raise
+        except Exception:
+            LOG_ENTRIES.inc(len(batch), outcome="failed")
+            logger.exception("Impossible d'écrire %d entrées du journal", len(batch))
+        else:
+            LOG_ENTRIES.inc(len(batch), outcome="written")
+
+
+log_writer = LogWriter(
+    queue_size=settings.LOG_QUEUE_SIZE,
+    batch_size=settings.LOG_BATCH_SIZE,
+    flush_interval=settings.LOG_FLUSH_INTERVAL,
+)
+
+metrics.gauge(
+    "request_log_queue_size",
+    "Entrées du journal en attente d'écriture.",
+    function=log_writer.qsize,
+)
+
+
+LOG_COMPACTED = metrics.counter(
+    "request_log_compacted_total",
+    "Entrées du journal regroupées en statistiques horaires puis supprimées.",
+)
+
+
+async def compact_logs(before: datetime, batch_size: int = 1000) -> int:
+    """Regroupe les entrées antérieures à `before` par heure, chemin et code.
+
+    Les entrées sont traitées par lots, chaque lot dans sa propre transaction,
+    et sont verrouillées pour que deux workers ne les comptent pas deux fois.
+    Retourne le nombre d'entrées compactées.
+    """
+    total = 0
+    while True:
+        async with in_transaction("default"):
+            rows = (
+                await Log.filter(date_creation__lt=before)
+                .order_by("id")
+                .limit(batch_size)
+                .select_for_update(skip_locked=True)
+                .values_list("id", "chemin", "code_reponse", "date_creation")
+            )
+            if not rows:
+                return total
+            counts = Counter(
+                (date.replace(minute=0, second=0, microsecond=0), chemin[:255], code)
+                for _, chemin, code, date in rows
+            )
+            for (heure, chemin, code), nombre in counts.items():
+                updated = await LogStatistique.filter(
+                    heure=heure, chemin=chemin, code_reponse=code
+                ).update(nombre=F("nombre") + nombre)
+                if not updated:
+                    await LogStatistique.create(
+                        heure=heure, chemin=chemin, code_reponse=code, nombre=nombre
+                    )
+            await Log.filter(id__in=[row[0] for row in rows]).delete()
+        total += len(rows)
+        LOG_COMPACTED.inc(len(rows))
+
+
+async def compact_expired_logs() -> None:
+    """Compacte les entrées plus anciennes que `LOG_RETENTION_DAYS`."""
+    await compact_logs(timezone.now() - timedelta(days=settings.LOG_RETENTION_DAYS))
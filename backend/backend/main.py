@@ -1,3 +1,5 @@
+import asyncio
+import time
 import typing
 from contextlib import asynccontextmanager
 
@@ -5,25 +7,64 @@ from fastapi import FastAPI, Request, Response
 from tortoise import Tortoise
 from tortoise.contrib.fastapi import RegisterTortoise
 
-from backend.models import Log
+from backend import hashing, idempotency, monitoring, snapshots, startup, tasks
+from backend.db import tortoise_config
+from backend.logs import compact_expired_logs, log_writer
+from backend.migrations import migrate
+from backend.models import Compte
+from backend.ratelimit import rate_limit
 from backend.routes import api_router
 from backend.settings import settings
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    async with RegisterTortoise(
-        app=app,
-        db_url=settings.DB_URL,
-        modules={"models": ["backend.models"]},
-        generate_schemas=True,
-    ):
+    started = time.perf_counter()
+    async with RegisterTortoise(app=app, config=tortoise_config()):
+        monitoring.instrument_database()
+        if settings.MIGRATE_ON_STARTUP:
+            await migrate()
+        else:
+            await startup.check_migrations()
+        log_writer.start()
+        tasks.start_periodic(
+            "log-compaction", settings.LOG_COMPACTION_INTERVAL, compact_expired_logs
+        )
+        tasks.start_periodic(
+            "pending-reconcile",
+            settings.PENDING_RECONCILE_INTERVAL,
+            Compte.reconcile_pending,
+        )
+        tasks.start_periodic(
+            "balance-snapshots",
+            settings.BALANCE_SNAPSHOT_INTERVAL,
+            snapshots.update_snapshots,
+        )
+        tasks.start_periodic(
+            "idempotency-expiry",
+            settings.IDEMPOTENCY_EXPIRY_INTERVAL,
+            idempotency.store.expire,
+        )
+        tasks.start(
+            "event-loop-lag",
+            monitoring.monitor_event_loop_lag(settings.EVENT_LOOP_LAG_INTERVAL),
+        )
+        warm_up = asyncio.create_task(startup.warm_up(app, started))
         yield
+        startup.set_ready(False)
+        warm_up.cancel()
+        await asyncio.gather(warm_up, return_exceptions=True)
+        await tasks.stop_all()
+        await log_writer.stop()
         await Tortoise.close_connections()
+    hashing.shutdown()
 
 
 app = FastAPI(title="SAE401-Back", lifespan=lifespan)
 app.include_router(api_router)
+# Ajouté avant `create_log_entry`, qui l'englobe : les requêtes refusées sont
+# aussi journalisées.
+app.middleware("http")(rate_limit)
 
 
 @app.middleware("http")
@@ -34,9 +75,14 @@ async def create_log_entry(
     if response.status_code == 307:
         # Ignore redirection
         return response
-    await Log.create(
+    log_writer.submit(
         ip=request.client.host if request.client else None,
         chemin=request.url.path,
         code_reponse=response.status_code,
     )
     return response
+
+
+# Ajouté en dernier, donc exécuté en premier : la durée mesurée couvre les
+# autres middlewares.
+app.middleware("http")(monitoring.record_request)
@@ -0,0 +1,145 @@
+"""Schéma initial : utilisateurs, comptes, opérations, décisions, validations
+et journal des requêtes.
+
+Les tables déjà présentes, sur une base créée auparavant par
+`generate_schemas`, sont conservées telles quelles.
+"""
+
+from tortoise import BaseDBAsyncClient
+
+from backend.migrations import run_ddl
+
+SQLITE = (
+    """CREATE TABLE IF NOT EXISTS "log" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "ip" VARCHAR(255),
+    "chemin" TEXT NOT NULL,
+    "code_reponse" INT NOT NULL,
+    "date_creation" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+)""",
+    """CREATE TABLE IF NOT EXISTS "logstatistique" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "heure" TIMESTAMP NOT NULL,
+    "chemin" VARCHAR(255) NOT NULL,
+    "code_reponse" INT NOT NULL,
+    "nombre" INT NOT NULL DEFAULT 0,
+    CONSTRAINT "uid_logstatisti_heure_d59ced" UNIQUE ("heure", "chemin", "code_reponse")
+)""",
+    """CREATE INDEX IF NOT EXISTS "idx_logstatisti_chemin_c4b472"
+    ON "logstatistique" ("chemin", "heure")""",
+    """CREATE TABLE IF NOT EXISTS "utilisateur" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "nom" VARCHAR(100) NOT NULL,
+    "email" VARCHAR(255) NOT NULL UNIQUE,
+    "password" VARCHAR(255) NOT NULL,
+    "role" VARCHAR(14) NOT NULL DEFAULT 'utilisateur',
+    "date_creation" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+)""",
+    """CREATE TABLE IF NOT EXISTS "compte" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "iban" VARCHAR(34) NOT NULL UNIQUE,
+    "type_compte" VARCHAR(14) NOT NULL,
+    "solde" VARCHAR(40) NOT NULL DEFAULT 0,
+    "date_creation" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "utilisateur_id" INT NOT NULL REFERENCES "utilisateur" ("id") ON DELETE CASCADE
+)""",
+    """CREATE TABLE IF NOT EXISTS "operation" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "type_operation" VARCHAR(8) NOT NULL,
+    "processed" INT NOT NULL DEFAULT 0,
+    "montant" VARCHAR(40) NOT NULL,
+    "date_creation" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "compte_destination_id" INT REFERENCES "compte" ("id") ON DELETE CASCADE,
+    "compte_source_id" INT REFERENCES "compte" ("id") ON DELETE CASCADE
+)""",
+    """CREATE TABLE IF NOT EXISTS "decision" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "valide" INT,
+    "date_creation" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "agent_id" INT REFERENCES "utilisateur" ("id") ON DELETE RESTRICT,
+    "operation_id" INT NOT NULL REFERENCES "operation" ("id") ON DELETE CASCADE
+)""",
+    """CREATE TABLE IF NOT EXISTS "validationcompte" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "valide" INT NOT NULL DEFAULT 0,
+    "date_validation" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "agent_id" INT REFERENCES "utilisateur" ("id") ON DELETE CASCADE,
+    "compte_id" INT NOT NULL REFERENCES "compte" ("id") ON DELETE CASCADE
+)""",
+)
+
+MYSQL = (
+    """CREATE TABLE IF NOT EXISTS `log` (
+    `id` INT NOT NULL PRIMARY KEY AUTO_INCREMENT,
+    `ip` VARCHAR(255),
+    `chemin` LONGTEXT NOT NULL,
+    `code_reponse` INT NOT NULL,
+    `date_creation` DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6)
+) CHARACTER SET utf8mb4""",
+    """CREATE TABLE IF NOT EXISTS `logstatistique` (
+    `id` INT NOT NULL PRIMARY KEY AUTO_INCREMENT,
+    `heure` DATETIME(6) NOT NULL,
+    `chemin` VARCHAR(255) NOT NULL,
+    `code_reponse` INT NOT NULL,
+    `nombre` INT NOT NULL DEFAULT 0,
+    UNIQUE KEY `uid_logstatisti_heure_d59ced` (`heure`, `chemin`, `code_reponse`),
+    KEY `idx_logstatisti_chemin_c4b472` (`chemin`, `heure`)
+) CHARACTER SET utf8mb4""",
+    """CREATE TABLE IF NOT EXISTS `utilisateur` (
+    `id` INT NOT NULL PRIMARY KEY AUTO_INCREMENT,
+    `nom` VARCHAR(100) NOT NULL,
+    `email` VARCHAR(255) NOT NULL UNIQUE,
+    `password` VARCHAR(255) NOT NULL,
+    `role` VARCHAR(14) NOT NULL DEFAULT 'utilisateur',
+    `date_creation` DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6)
+) CHARACTER SET utf8mb4""",
+    """CREATE TABLE IF NOT EXISTS `compte` (
+    `id` INT NOT NULL PRIMARY KEY AUTO_INCREMENT,
+    `iban` VARCHAR(34) NOT NULL UNIQUE,
+    `type_compte` VARCHAR(14) NOT NULL,
+    `solde` DECIMAL(10,2) NOT NULL DEFAULT 0,
+    `date_creation` DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    `utilisateur_id` INT NOT NULL,
+    CONSTRAINT `fk_compte_utilisat_e3c66c8b` FOREIGN KEY (`utilisateur_id`)
+        REFERENCES `utilisateur` (`id`) ON DELETE CASCADE
+) CHARACTER SET utf8mb4""",
+    """CREATE TABLE IF NOT EXISTS `operation` (
+    `id` INT NOT NULL PRIMARY KEY AUTO_INCREMENT,
+    `type_operation` VARCHAR(8) NOT NULL,
+    `processed` BOOL NOT NULL DEFAULT 0,
+    `montant` DECIMAL(16,2) NOT NULL,
+    `date_creation` DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    `compte_destination_id` INT,
+    `compte_source_id` INT,
+    CONSTRAINT `fk_operatio_compte_573439ea` FOREIGN KEY (`compte_destination_id`)
+        REFERENCES `compte` (`id`) ON DELETE CASCADE,
+    CONSTRAINT `fk_operatio_compte_b0338b2c` FOREIGN KEY (`compte_source_id`)
+        REFERENCES `compte` (`id`) ON DELETE CASCADE
+) CHARACTER SET utf8mb4""",
+    """CREATE TABLE IF NOT EXISTS `decision` (
+    `id` INT NOT NULL PRIMARY KEY AUTO_INCREMENT,
+    `valide` BOOL,
+    `date_creation` DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    `agent_id` INT,
+    `operation_id` INT NOT NULL,
+    CONSTRAINT `fk_decision_utilisat_4d1e1762` FOREIGN KEY (`agent_id`)
+        REFERENCES `utilisateur` (`id`) ON DELETE RESTRICT,
+    CONSTRAINT `fk_decision_operatio_9bdf80e9` FOREIGN KEY (`operation_id`)
+        REFERENCES `operation` (`id`) ON DELETE CASCADE
+) CHARACTER SET utf8mb4""",
+    """CREATE TABLE IF NOT EXISTS `validationcompte` (
+    `id` INT NOT NULL PRIMARY KEY AUTO_INCREMENT,
+    `valide` BOOL NOT NULL DEFAULT 0,
+    `date_validation` DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    `agent_id` INT,
+    `compte_id` INT NOT NULL,
+    CONSTRAINT `fk_validati_utilisat_686a3b01` FOREIGN KEY (`agent_id`)
+        REFERENCES `utilisateur` (`id`) ON DELETE CASCADE,
+    CONSTRAINT `fk_validati_compte_9400bed9` FOREIGN KEY (`compte_id`)
+        REFERENCES `compte` (`id`) ON DELETE CASCADE
+) CHARACTER SET utf8mb4""",
+)
+
+
+async def upgrade(db: BaseDBAsyncClient) -> None:
+    await run_ddl(db, {"sqlite": SQLITE, "mysql": MYSQL})
@@ -0,0 +1,17 @@
+"""Ajoute le total des débits en attente sur chaque compte, et le calcule."""
+
+from tortoise import BaseDBAsyncClient
+
+from backend.migrations import ensure_column
+
+
+async def upgrade(db: BaseDBAsyncClient) -> None:
+    if await ensure_column(
+        db, "compte", "solde_en_attente", "DECIMAL(10,2) NOT NULL DEFAULT 0"
+    ):
+        await db.execute_script(
+            "UPDATE compte SET solde_en_attente = COALESCE(("
+            " SELECT -SUM(montant) FROM operation"
+            " WHERE operation.compte_source_id = compte.id AND operation.processed = 0"
+            "), 0)"
+        )
@@ -0,0 +1,28 @@
+"""Index des requêtes les plus fréquentes.
+
+- historique d'un compte : `compte_source_id` ou `compte_destination_id`,
+  trié par `date_creation` ;
+- opérations à valider : `processed` ;
+- décision d'une opération et validation d'un compte : clés étrangères,
+  que SQLite n'indexe pas d'elle-même ;
+- consultation des logs : `date_creation`, et `ip` puis `date_creation`.
+"""
+
+from tortoise import BaseDBAsyncClient
+
+from backend.migrations import ensure_index
+
+INDEXES = (
+    ("operation", ("compte_source_id", "date_creation")),
+    ("operation", ("compte_destination_id", "date_creation")),
+    ("operation", ("processed",)),
+    ("decision", ("operation_id",)),
+    ("validationcompte", ("compte_id",)),
+    ("log", ("date_creation",)),
+    ("log", ("ip", "date_creation")),
+)
+
+
+async def upgrade(db: BaseDBAsyncClient) -> None:
+    for table, columns in INDEXES:
+        await ensure_index(db, table, columns)
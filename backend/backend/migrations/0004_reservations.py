@@ -0,0 +1,52 @@
+"""Réservations de fonds des retraits et virements.
+
+Crée la table `reservation`, puis une réservation active pour chaque débit
+pas encore traité, du montant déjà compté dans `compte.solde_en_attente`.
+"""
+
+from tortoise import BaseDBAsyncClient
+
+from backend.migrations import run_ddl
+
+SQLITE = (
+    """CREATE TABLE IF NOT EXISTS "reservation" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "montant" VARCHAR(40) NOT NULL,
+    "statut" VARCHAR(8) NOT NULL DEFAULT 'active',
+    "date_creation" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "date_cloture" TIMESTAMP,
+    "compte_id" INT NOT NULL REFERENCES "compte" ("id") ON DELETE CASCADE,
+    "operation_id" INT NOT NULL UNIQUE REFERENCES "operation" ("id") ON DELETE CASCADE
+)""",
+    """CREATE INDEX IF NOT EXISTS "idx_reservation_compte__5d7f19"
+    ON "reservation" ("compte_id", "statut")""",
+)
+
+MYSQL = (
+    """CREATE TABLE IF NOT EXISTS `reservation` (
+    `id` INT NOT NULL PRIMARY KEY AUTO_INCREMENT,
+    `montant` DECIMAL(10,2) NOT NULL,
+    `statut` VARCHAR(8) NOT NULL DEFAULT 'active',
+    `date_creation` DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    `date_cloture` DATETIME(6),
+    `compte_id` INT NOT NULL,
+    `operation_id` INT NOT NULL UNIQUE,
+    CONSTRAINT `fk_reservat_compte_24791615` FOREIGN KEY (`compte_id`)
+        REFERENCES `compte` (`id`) ON DELETE CASCADE,
+    CONSTRAINT `fk_reservat_operatio_82d46bc9` FOREIGN KEY (`operation_id`)
+        REFERENCES `operation` (`id`) ON DELETE CASCADE,
+    KEY `idx_reservation_compte__5d7f19` (`compte_id`, `statut`)
+) CHARACTER SET utf8mb4""",
+)
+
+
+async def upgrade(db: BaseDBAsyncClient) -> None:
+    await run_ddl(db, {"sqlite": SQLITE, "mysql": MYSQL})
+    await db.execute_script(
+        "INSERT INTO reservation"
+        " (compte_id, operation_id, montant, statut, date_creation)"
+        " SELECT o.compte_source_id, o.id, -o.montant, 'active', o.date_creation"
+        " FROM operation o"
+        " WHERE o.compte_source_id IS NOT NULL AND o.processed = 0"
+        " AND NOT EXISTS (SELECT 1 FROM reservation r WHERE r.operation_id = o.id)"
+    )
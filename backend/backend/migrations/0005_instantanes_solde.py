@@ -0,0 +1,47 @@
+"""Instantanés de solde des comptes.
+
+La table est créée vide : la tâche de fond `backend.snapshots` la remplit
+en reprenant les décisions depuis la première.
+"""
+
+from tortoise import BaseDBAsyncClient
+
+from backend.migrations import run_ddl
+
+SQLITE = (
+    """CREATE TABLE IF NOT EXISTS "soldeinstantane" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "decision_id" INT NOT NULL,
+    "solde" VARCHAR(40) NOT NULL,
+    "date_decision" TIMESTAMP NOT NULL,
+    "decisions" INT NOT NULL DEFAULT 0,
+    "debut_operations" TIMESTAMP NOT NULL,
+    "compte_id" INT NOT NULL REFERENCES "compte" ("id") ON DELETE CASCADE,
+    CONSTRAINT "uid_soldeinstan_compte__f67ec3" UNIQUE ("compte_id", "decision_id")
+)""",
+    """CREATE INDEX IF NOT EXISTS "idx_soldeinstan_compte__090fd6"
+    ON "soldeinstantane" ("compte_id", "date_decision")""",
+    """CREATE INDEX IF NOT EXISTS "idx_soldeinstan_decisio_52c8f8"
+    ON "soldeinstantane" ("decision_id")""",
+)
+
+MYSQL = (
+    """CREATE TABLE IF NOT EXISTS `soldeinstantane` (
+    `id` INT NOT NULL PRIMARY KEY AUTO_INCREMENT,
+    `decision_id` INT NOT NULL,
+    `solde` DECIMAL(10,2) NOT NULL,
+    `date_decision` DATETIME(6) NOT NULL,
+    `decisions` INT NOT NULL DEFAULT 0,
+    `debut_operations` DATETIME(6) NOT NULL,
+    `compte_id` INT NOT NULL,
+    UNIQUE KEY `uid_soldeinstan_compte__f67ec3` (`compte_id`, `decision_id`),
+    CONSTRAINT `fk_soldeins_compte_ad86aa71` FOREIGN KEY (`compte_id`)
+        REFERENCES `compte` (`id`) ON DELETE CASCADE,
+    KEY `idx_soldeinstan_compte__090fd6` (`compte_id`, `date_decision`),
+    KEY `idx_soldeinstan_decisio_52c8f8` (`decision_id`)
+) CHARACTER SET utf8mb4""",
+)
+
+
+async def upgrade(db: BaseDBAsyncClient) -> None:
+    await run_ddl(db, {"sqlite": SQLITE, "mysql": MYSQL})
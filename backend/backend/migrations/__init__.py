@@ -0,0 +1,204 @@
+"""Migrations versionnées du schéma de la base de données.
+
+Chaque module `NNNN_nom.py` de ce paquet expose une coroutine
+`upgrade(db)`. Les versions appliquées sont enregistrées dans la table
+`schema_migration`, et seules les suivantes sont exécutées.
+
+Une migration ne dépend pas des modèles actuels : les tables sont créées
+par des instructions DDL figées, écrites pour chaque dialecte (`run_ddl`),
+pour que rejouer les migrations sur une base vide reproduise le schéma de
+chaque version.
+
+MySQL valide implicitement chaque instruction DDL : une migration ne peut donc
+pas être annulée à mi-chemin. Elles sont écrites pour pouvoir être rejouées
+sans erreur (`CREATE TABLE IF NOT EXISTS`, `ensure_index`, `ensure_column`,
+...).
+
+Les migrations sont appliquées sous un verrou exclusif, pour que plusieurs
+workers démarrés ensemble ne les appliquent pas deux fois.
+"""
+
+import asyncio
+import contextlib
+import importlib
+import logging
+import pkgutil
+import re
+import types
+import typing
+
+from tortoise import BaseDBAsyncClient, Tortoise
+from tortoise.transactions import in_transaction
+
+from backend.db import placeholder
+
+logger = logging.getLogger(__name__)
+
+_MIGRATION_NAME = re.compile(r"^(\d{4})_\w+$")
+
+# Verrou MySQL (`GET_LOCK`) tenu pendant l'application des migrations, et
+# attente maximale, en secondes, de sa libération par un autre worker
+LOCK_NAME = "schema_migration"
+LOCK_TIMEOUT = 300
+
+_local_lock = asyncio.Lock()
+
+
+class Migration(typing.NamedTuple):
+    version: int
+    nom: str
+    module: types.ModuleType
+
+
+def discover() -> list[Migration]:
+    """Liste les migrations du paquet, triées par version."""
+    migrations = []
+    for module_info in pkgutil.iter_modules(__path__):
+        match = _MIGRATION_NAME.match(module_info.name)
+        if not match:
+            continue
+        module = importlib.import_module(f"{__name__}.{module_info.name}")
+        migrations.append(Migration(int(match[1]), module_info.name, module))
+    return sorted(migrations)
+
+
+async def applied_versions(db: BaseDBAsyncClient) -> set[int]:
+    await db.execute_script(
+        "CREATE TABLE IF NOT EXISTS schema_migration ("
+        " version INT NOT NULL PRIMARY KEY,"
+        " nom VARCHAR(255) NOT NULL,"
+        " date_application TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP"
+        ")"
+    )
+    _, rows = await db.execute_query("SELECT version FROM schema_migration")
+    return {row["version"] for row in rows}
+
+
+async def pending(db: BaseDBAsyncClient | None = None) -> list[Migration]:
+    """Retourne les migrations pas encore appliquées."""
+    db = db or Tortoise.get_connection("default")
+    done = await applied_versions(db)
+    return [migration for migration in discover() if migration.version not in done]
+
+
+@contextlib.asynccontextmanager
+async def locked(db: BaseDBAsyncClient) -> typing.AsyncIterator[BaseDBAsyncClient]:
+    """Connexion à utiliser pour les migrations, sous verrou exclusif.
+
+    Sous MySQL, le verrou nommé `LOCK_NAME` est pris sur une connexion
+    réservée, qui sert aussi aux migrations : les autres workers attendent
+    qu'il soit libéré, puis ne trouvent plus de migration en attente. Une
+    base SQLite n'est partagée qu'au sein du processus.
+    """
+    async with _local_lock:
+        if db.capabilities.dialect != "mysql":
+            yield db
+            return
+        async with in_transaction(db.connection_name) as connection:
+            _, rows = await connection.execute_query(
+                "SELECT GET_LOCK(%s, %s) AS verrou", [LOCK_NAME, LOCK_TIMEOUT]
+            )
+            if rows[0]["verrou"] != 1:
+                raise RuntimeError(
+                    f"Verrou des migrations non obtenu après {LOCK_TIMEOUT} s"
+                )
+            try:
+                yield connection
+            finally:
+                await connection.execute_query("SELECT RELEASE_LOCK(%s)", [LOCK_NAME])
+
+
+async def migrate(db: BaseDBAsyncClient | None = None) -> list[Migration]:
+    """Applique les migrations en attente, dans l'ordre des versions."""
+    applied = []
+    async with locked(db or Tortoise.get_connection("default")) as db:
+        for migration in await pending(db):
+            logger.info("Application de la migration %s", migration.nom)
+            await migration.module.upgrade(db)
+            await db.execute_query(
+                "INSERT INTO schema_migration (version, nom) VALUES "
+                f"({placeholder(db)}, {placeholder(db)})",
+                [migration.version, migration.nom],
+            )
+            applied.append(migration)
+    return applied
+
+
+async def run_ddl(
+    db: BaseDBAsyncClient, statements: dict[str, typing.Sequence[str]]
+) -> None:
+    """Exécute les instructions DDL écrites pour le dialecte de `db`."""
+    dialect = db.capabilities.dialect
+    if dialect not in statements:
+        raise RuntimeError(f"Migration non écrite pour le dialecte {dialect}")
+    for statement in statements[dialect]:
+        await db.execute_script(statement)
+
+
+async def table_indexes(db: BaseDBAsyncClient, table: str) -> list[list[str]]:
+    """Retourne les colonnes de chaque index d'une table, dans l'ordre."""
+    if db.capabilities.dialect == "sqlite":
+        _, index_list = await db.execute_query(f'PRAGMA index_list("{table}")')
+        columns = []
+        for index in index_list:
+            _, info = await db.execute_query(f'PRAGMA index_info("{index["name"]}")')
+            columns.append(
+                [row["name"] for row in sorted(info, key=lambda r: r["seqno"])]
+            )
+        return columns
+
+    _, rows = await db.execute_query(
+        "SELECT index_name AS nom, column_name AS colonne"
+        " FROM information_schema.statistics"
+        f" WHERE table_schema = DATABASE() AND table_name = {placeholder(db)}"
+        " ORDER BY index_name, seq_in_index",
+        [table],
+    )
+    indexes: dict[str, list[str]] = {}
+    for row in rows:
+        indexes.setdefault(row["nom"], []).append(row["colonne"])
+    return list(indexes.values())
+
+
+async def ensure_index(
+    db: BaseDBAsyncClient, table: str, columns: typing.Sequence[str]
+) -> bool:
+    """Crée un index sur `columns`, sauf si un index existant les couvre déjà.
+
+    Retourne `True` si l'index a été créé.
+    """
+    for existing in await table_indexes(db, table):
+        if existing[: len(columns)] == list(columns):
+            return False
+    name = f"idx_{table}_{'_'.join(columns)}"[:64]
+    quoted = ", ".join(f'"{column}"' for column in columns)
+    if db.capabilities.dialect == "mysql":
+        quoted = quoted.replace('"', "`")
+        await db.execute_script(f"CREATE INDEX `{name}` ON `{table}` ({quoted})")
+    else:
+        await db.execute_script(f'CREATE INDEX "{name}" ON "{table}" ({quoted})')
+    logger.info("Index %s créé", name)
+    return True
+
+
+async def has_column(db: BaseDBAsyncClient, table: str, column: str) -> bool:
+    if db.capabilities.dialect == "sqlite":
+        _, rows = await db.execute_query(f'PRAGMA table_info("{table}")')
+        return any(row["name"] == column for row in rows)
+    _, rows = await db.execute_query(
+        "SELECT 1 FROM information_schema.columns WHERE table_schema = DATABASE()"
+        f" AND table_name = {placeholder(db)} AND column_name = {placeholder(db)}",
+        [table, column],
+    )
+    return bool(rows)
+
+
+async def ensure_column(
+    db: BaseDBAsyncClient, table: str, column: str, definition: str
+) -> bool:
+    """Ajoute une colonne si elle n'existe pas. Retourne `True` si ajoutée."""
+    if await has_column(db, table, column):
+        return False
+    await db.execute_script(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    logger.info("Colonne %s.%s ajoutée", table, column)
+    return True
@@ -0,0 +1,45 @@
+"""Applique ou inspecte les migrations hors du démarrage de l'application.
+
+python -m backend.migrations upgrade   # applique les migrations en attente
+python -m backend.migrations status    # liste les migrations en attente
+python -m backend.migrations explain   # vérifie l'usage des index
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+
+from tortoise import Tortoise
+
+from backend.db import tortoise_config
+from backend.migrations import explain, migrate, pending
+
+
+async def main(command: str) -> int:
+    await Tortoise.init(config=tortoise_config())
+    try:
+        if command == "upgrade":
+            for migration in await migrate():
+                print(f"appliquée : {migration.nom}")
+        elif command == "status":
+            for migration in await pending():
+                print(f"en attente : {migration.nom}")
+        elif command == "explain":
+            plans = await explain.check()
+            for plan in plans:
+                status = "PARCOURS COMPLET" if plan.full_scan else "ok"
+                print(f"[{status}] {plan.nom}")
+                for ligne in plan.lignes:
+                    print(f"    {ligne}")
+            return int(any(plan.full_scan for plan in plans))
+    finally:
+        await Tortoise.close_connections()
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(prog="python -m backend.migrations")
+    parser.add_argument("command", choices=["upgrade", "status", "explain"])
+    sys.exit(asyncio.run(main(parser.parse_args().command)))
@@ -0,0 +1,61 @@
+"""Vérifie, avec `EXPLAIN`, que les requêtes fréquentes utilisent un index.
+
+Une requête est signalée si son plan parcourt une table entière : `type`
+`ALL` sous MySQL, `SCAN <table>` sans index sous SQLite.
+"""
+
+import typing
+
+from tortoise import BaseDBAsyncClient, Tortoise
+from tortoise.queryset import QuerySet
+
+from backend.models import Compte, Log, Operation, ValidationCompte
+
+
+class Plan(typing.NamedTuple):
+    nom: str
+    sql: str
+    lignes: list[str]
+    full_scan: bool
+
+
+def hot_queries() -> dict[str, QuerySet]:
+    """Requêtes des routes les plus sollicitées, avec des valeurs d'exemple."""
+    compte = Compte(id=1)
+    return {
+        "historique d'un compte": Operation.filter_by_account(compte).order_by(
+            "date_creation"
+        ),
+        "opérations à valider": Operation.filter(processed=False),
+        "débits en attente d'un compte": Operation.filter(
+            compte_source_id=1, processed=False
+        ),
+        "validation d'un compte": ValidationCompte.filter(compte_id=1),
+        "logs récents": Log.all().order_by("-date_creation").limit(10),
+        "logs d'une ip": Log.filter(ip="127.0.0.1")
+        .order_by("-date_creation")
+        .limit(10),
+    }
+
+
+async def explain(db: BaseDBAsyncClient, nom: str, queryset: QuerySet) -> Plan:
+    sql = queryset.sql(params_inline=True)
+    if db.capabilities.dialect == "sqlite":
+        _, rows = await db.execute_query(f"EXPLAIN QUERY PLAN {sql}")
+        lignes = [row["detail"] for row in rows]
+        full_scan = any(
+            ligne.startswith("SCAN ") and "USING" not in ligne for ligne in lignes
+        )
+    else:
+        _, rows = await db.execute_query(f"EXPLAIN {sql}")
+        lignes = [
+            f"{row['table']}: type={row['type']} key={row['key']}" for row in rows
+        ]
+        full_scan = any(row["type"] == "ALL" for row in rows)
+    return Plan(nom, sql, lignes, full_scan)
+
+
+async def check(db: BaseDBAsyncClient | None = None) -> list[Plan]:
+    """Retourne le plan de chaque requête fréquente."""
+    db = db or Tortoise.get_connection("default")
+    return [await explain(db, nom, qs) for nom, qs in hot_queries().items()]
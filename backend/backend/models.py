@@ -1,15 +1,38 @@
+import logging
 import typing
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
 from enum import Enum
-from functools import partial
 
 from fastapi import HTTPException
-from passlib.hash import sha256_crypt
-from schwifty import IBAN
-from tortoise import BaseDBAsyncClient, Model, fields
-from tortoise.expressions import Q
-from tortoise.signals import post_save, pre_save
+from tortoise import BaseDBAsyncClient, Model, fields, timezone
+from tortoise.expressions import F, Q
+from tortoise.functions import Sum
+from tortoise.signals import post_delete, post_save, pre_save
 from tortoise.transactions import in_transaction
 
+from backend import metrics
+from backend.cache import MISSING, TTLCache
+from backend.db import placeholder
+from backend.hashing import check_password, hash_password
+from backend.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Statut de validation de chaque compte : `True`, `False`, ou `None` tant
+# qu'aucun agent ne s'est prononcé
+validation_cache: TTLCache[int, bool | None] = TTLCache(
+    "validation_compte",
+    maxsize=settings.VALIDATION_CACHE_SIZE,
+    ttl=settings.VALIDATION_CACHE_TTL,
+)
+
+PENDING_MISMATCHES = metrics.counter(
+    "account_pending_total_mismatches_total",
+    "Écarts corrigés entre le solde en attente maintenu et les opérations en cours.",
+)
+
 
 class TypeUtilisateur(str, Enum):
     USER = "utilisateur"
@@ -26,11 +49,11 @@ class Utilisateur(Model):
 
     comptes: fields.ReverseRelation["Compte"]
 
-    def verify_password(self, password: str) -> bool:
+    async def verify_password(self, password: str) -> bool:
         """
         Vérifie si le mot de passe en clair correspond au mot de passe haché.
         """
-        return sha256_crypt.verify(password, self.password)
+        return await check_password(password, self.password)
 
     class PydanticMeta:
         exclude = ["password"]
@@ -58,7 +81,19 @@ async def user_hash_password(
     if not instance.password:
         raise ValueError("Le mot de passe ne peut pas être vide.")
     if not instance.password.startswith("$5$"):
-        instance.password = sha256_crypt.hash(instance.password)
+        instance.password = await hash_password(instance.password)
+
+
+def random_iban() -> str:
+    """IBAN français aléatoire.
+
+    `schwifty` charge ses registres bancaires à l'import, ce qui coûte
+    plusieurs centaines de millisecondes : il n'est importé qu'au premier
+    appel, ou pendant la préparation qui suit le démarrage.
+    """
+    from schwifty import IBAN
+
+    return IBAN.random(country_code="FR")
 
 
 class TypeCompte(str, Enum):
@@ -68,31 +103,103 @@ class TypeCompte(str, Enum):
 
 class Compte(Model):
     id = fields.IntField(primary_key=True, unique=True)
-    iban = fields.CharField(
-        max_length=34, unique=True, default=partial(IBAN.random, country_code="FR")
-    )
+    iban = fields.CharField(max_length=34, unique=True, default=random_iban)
     utilisateur: fields.ForeignKeyRelation["Utilisateur"] = fields.ForeignKeyField(
         "models.Utilisateur", related_name="comptes"
     )
     type_compte = fields.CharEnumField(TypeCompte)
     solde = fields.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    # Total des réservations actives (retraits, virements émis pas encore traités)
+    solde_en_attente = fields.DecimalField(
+        max_digits=10, decimal_places=2, default=0.00
+    )
     validation: fields.ReverseRelation["ValidationCompte"]
+    reservations: fields.ReverseRelation["Reservation"]
 
     date_creation = fields.DatetimeField(auto_now_add=True)
 
-    async def get_allowed_balance(self) -> float:
-        """Obtiens le solde autorisé en prenant en compte les transactions non traitées."""
-        current = self.solde
-        transactions = await Operation.filter_by_account(self).filter(processed=False)
-        for transaction in transactions:
-            current += transaction.montant
-        return float(current)
+    async def reserve(self, montant: Decimal) -> bool:
+        """Réserve `montant` sur le solde disponible du compte.
+
+        La réservation est un `UPDATE` conditionnel : elle n'est appliquée que
+        si le solde moins les réservations actives couvre le montant. Deux
+        débits concurrents ne peuvent donc pas dépasser le solde, sans verrou
+        applicatif. Retourne `False` si le solde est insuffisant.
+        """
+        reserved = (
+            await Compte.filter(id=self.id)
+            .annotate(reste=F("solde") - (F("solde_en_attente") + montant))
+            .filter(reste__gte=0)
+            .update(solde_en_attente=F("solde_en_attente") + montant)
+        )
+        return bool(reserved)
+
+    @classmethod
+    async def reconcile_pending(cls) -> int:
+        """Vérifie le solde en attente de chaque compte contre ses réservations.
+
+        Les comptes en écart sont recalculés sous verrou puis corrigés.
+        Retourne le nombre de comptes corrigés.
+        """
+        expected = {
+            row["compte_id"]: row["total"]
+            for row in await Reservation.filter(statut=StatutReservation.ACTIVE)
+            .annotate(total=Sum("montant"))
+            .group_by("compte_id")
+            .values("compte_id", "total")
+        }
+        stored = await cls.filter(
+            Q(solde_en_attente__not=0) | Q(id__in=list(expected))
+        ).values_list("id", "solde_en_attente")
+
+        fixed = 0
+        for compte_id, solde_en_attente in stored:
+            if solde_en_attente == expected.get(compte_id, 0):
+                continue
+            async with in_transaction("default"):
+                # L'écart a pu être résorbé depuis la première lecture : le
+                # solde en attente est relu sous verrou avant d'être corrigé.
+                compte = await cls.filter(id=compte_id).select_for_update().first()
+                if compte is None:
+                    continue
+                total = (
+                    await Reservation.filter(
+                        compte_id=compte_id, statut=StatutReservation.ACTIVE
+                    )
+                    .annotate(total=Sum("montant"))
+                    .first()
+                    .values_list("total", flat=True)
+                ) or 0
+                if compte.solde_en_attente == total:
+                    continue
+                await cls.filter(id=compte_id).update(solde_en_attente=total)
+            logger.warning(
+                "Solde en attente du compte %s corrigé : %s -> %s",
+                compte_id,
+                compte.solde_en_attente,
+                total,
+            )
+            PENDING_MISMATCHES.inc()
+            fixed += 1
+        return fixed
 
     async def ensure_validated(self) -> typing.Literal[True]:
-        validation = await ValidationCompte.filter(compte=self).get_or_none()
-        if not validation:
+        """Vérifie que le compte a été validé par un agent.
+
+        Le statut est lu dans `validation_cache`, et en base seulement s'il
+        n'y est pas ; `None` signifie qu'aucune décision n'a encore été prise.
+        """
+        valide = validation_cache.get(self.id)
+        if valide is MISSING:
+            # Un compte peut avoir plusieurs validations : la plus récente compte
+            validation = (
+                await ValidationCompte.filter(compte=self).order_by("-id").first()
+            )
+            valide = validation.valide if validation else None
+            validation_cache.set(self.id, valide)
+        if valide is None:
             raise HTTPException(status_code=403, detail="Account not yet validated.")
-        if not validation.valide:
+        if not valide:
             raise HTTPException(status_code=403, detail="Account not validated.")
         return True
 
@@ -120,11 +227,40 @@ class ValidationCompte(Model):
     compte: fields.ForeignKeyRelation["Compte"] = fields.ForeignKeyField(
         "models.Compte", related_name="validation"
     )
+    compte_id: int
     agent: fields.ForeignKeyNullableRelation["Utilisateur"] = fields.ForeignKeyField(
         "models.Utilisateur", related_name="validation_agent", null=True
     )
     date_validation = fields.DatetimeField(auto_now_add=True)
 
+    class Meta(Model.Meta):
+        indexes = (("compte_id",),)
+
+
+@post_save(ValidationCompte)
+async def invalidate_validation(
+    sender: type[ValidationCompte],
+    instance: ValidationCompte,
+    created: bool,
+    using_db: BaseDBAsyncClient | None,
+    update_fields: list[str],
+) -> None:
+    """Retire du cache le statut de validation d'un compte qui vient de changer.
+
+    Le statut n'est pas réécrit directement : si la transaction en cours est
+    annulée, la prochaine lecture le relira en base.
+    """
+    validation_cache.invalidate(instance.compte_id)
+
+
+@post_delete(ValidationCompte)
+async def invalidate_deleted_validation(
+    sender: type[ValidationCompte],
+    instance: ValidationCompte,
+    using_db: BaseDBAsyncClient | None,
+) -> None:
+    validation_cache.invalidate(instance.compte_id)
+
 
 class TypeOperation(str, Enum):
     DEPOT = "depot"
@@ -139,11 +275,13 @@ class Operation(Model):
     compte_source: fields.ForeignKeyNullableRelation["Compte"] = fields.ForeignKeyField(
         "models.Compte", related_name="operations_source", null=True
     )
+    compte_source_id: int | None
     compte_destination: fields.ForeignKeyNullableRelation["Compte"] = (
         fields.ForeignKeyField(
             "models.Compte", related_name="operations_destination", null=True
         )
     )
+    compte_destination_id: int | None
 
     processed = fields.BooleanField(default=False)
     montant = fields.DecimalField(max_digits=16, decimal_places=2)
@@ -151,9 +289,19 @@ class Operation(Model):
 
     date_creation = fields.DatetimeField(auto_now_add=True)
 
+    class Meta(Model.Meta):
+        indexes = (
+            ("compte_source_id", "date_creation"),
+            ("compte_destination_id", "date_creation"),
+            ("processed",),
+        )
+
     @classmethod
     async def filter_unvalidated(cls) -> typing.Iterable[typing.Self]:
-        return await cls.filter(decision=None)
+        # Une opération est marquée traitée en même temps que sa décision est
+        # créée : le filtre indexé sur `processed` évite la jointure anti-semi
+        # sur `decision`.
+        return await cls.filter(processed=False)
 
     @classmethod
     def filter_by_account(cls, compte: "Compte", prefetch_decisions: bool = False):
@@ -162,6 +310,86 @@ class Operation(Model):
             return op.prefetch_related("decision")
         return op
 
+    @classmethod
+    async def recent_by_user(
+        cls, user: "Utilisateur", limit: int
+    ) -> dict[str, list[typing.Self]]:
+        """Les `limit` opérations les plus récentes de chaque compte d'un utilisateur.
+
+        Une seule requête : les opérations des comptes de l'utilisateur, côté
+        source et côté destination, sont numérotées par compte avec
+        `ROW_NUMBER()`, puis jointes aux comptes pour que ceux sans opération
+        apparaissent aussi. Le résultat est indexé par IBAN.
+        """
+        db = cls._choose_db()
+        param = placeholder(db)
+        columns = ", ".join(f"o.{column}" for column in cls._meta.db_fields)
+        selected = ", ".join(f"r.{column}" for column in cls._meta.db_fields)
+        sql = f"""
+            SELECT c.iban AS iban_compte, {selected}
+            FROM compte c
+            LEFT JOIN (
+                SELECT t.*, ROW_NUMBER() OVER (
+                    PARTITION BY t.compte_id ORDER BY t.date_creation DESC, t.id DESC
+                ) AS rang
+                FROM (
+                    SELECT o.compte_source_id AS compte_id, {columns}
+                    FROM operation o JOIN compte s ON s.id = o.compte_source_id
+                    WHERE s.utilisateur_id = {param}
+                    UNION ALL
+                    SELECT o.compte_destination_id AS compte_id, {columns}
+                    FROM operation o JOIN compte d ON d.id = o.compte_destination_id
+                    WHERE d.utilisateur_id = {param}
+                ) t
+            ) r ON r.compte_id = c.id AND r.rang <= {param}
+            WHERE c.utilisateur_id = {param}
+            ORDER BY c.id, r.rang
+        """
+        rows = await db.execute_query_dict(sql, [user.id, user.id, limit, user.id])
+
+        operations: dict[str, list[typing.Self]] = {}
+        for row in rows:
+            iban = row.pop("iban_compte")
+            recent = operations.setdefault(iban, [])
+            if row["id"] is not None:
+                recent.append(cls._init_from_db(**row))
+        return operations
+
+    @classmethod
+    def page_by_account(
+        cls,
+        compte: "Compte",
+        limit: int,
+        after: tuple[datetime, int] | None = None,
+        debut: datetime | None = None,
+        fin: datetime | None = None,
+        ascending: bool = False,
+    ):
+        """Page d'opérations d'un compte, triée par `(date_creation, id)`.
+
+        `after` est la clé de la dernière opération de la page précédente.
+        """
+        op = cls.filter_by_account(compte)
+        if debut:
+            op = op.filter(date_creation__gte=debut)
+        if fin:
+            op = op.filter(date_creation__lt=fin)
+        if after:
+            date_creation, id = after
+            if ascending:
+                op = op.filter(
+                    Q(date_creation__gt=date_creation)
+                    | Q(date_creation=date_creation, id__gt=id)
+                )
+            else:
+                op = op.filter(
+                    Q(date_creation__lt=date_creation)
+                    | Q(date_creation=date_creation, id__lt=id)
+                )
+        if ascending:
+            return op.order_by("date_creation", "id").limit(limit)
+        return op.order_by("-date_creation", "-id").limit(limit)
+
 
 class Decision(Model):
     id = fields.IntField(primary_key=True, unique=True)
@@ -177,6 +405,93 @@ class Decision(Model):
     )
     date_creation = fields.DatetimeField(auto_now_add=True)
 
+    class Meta(Model.Meta):
+        indexes = (("operation_id",),)
+
+
+class StatutReservation(str, Enum):
+    ACTIVE = "active"
+    CAPTUREE = "capturee"
+    LIBEREE = "liberee"
+
+
+class Reservation(Model):
+    """Fonds réservés sur un compte pour un débit pas encore traité.
+
+    La réservation est capturée si l'opération est acceptée, libérée si elle
+    est refusée. Le total des réservations actives d'un compte est maintenu
+    dans `Compte.solde_en_attente`.
+    """
+
+    id = fields.IntField(primary_key=True, unique=True)
+    compte: fields.ForeignKeyRelation["Compte"] = fields.ForeignKeyField(
+        "models.Compte", related_name="reservations"
+    )
+    operation: fields.OneToOneRelation["Operation"] = fields.OneToOneField(
+        "models.Operation", related_name="reservation"
+    )
+    montant = fields.DecimalField(max_digits=10, decimal_places=2)
+    statut = fields.CharEnumField(StatutReservation, default=StatutReservation.ACTIVE)
+    date_creation = fields.DatetimeField(auto_now_add=True)
+    date_cloture = fields.DatetimeField(null=True)
+
+    class Meta(Model.Meta):
+        indexes = (("compte_id", "statut"),)
+
+
+def balance_effect(compte_id: int, row: dict) -> Decimal:
+    """Variation du solde du compte si l'opération `row` est acceptée.
+
+    `row` porte les champs `type_operation`, `compte_source_id` et `montant`
+    de l'opération ; le montant d'un débit est négatif.
+    """
+    if row["compte_source_id"] == compte_id:
+        return row["montant"]
+    if row["type_operation"] == TypeOperation.VIREMENT:
+        return -row["montant"]
+    return row["montant"]
+
+
+async def apply_decisions(decisions: typing.Iterable[tuple[Operation, bool]]) -> None:
+    """Applique aux comptes l'effet de décisions prises sur des opérations.
+
+    Les variations sont cumulées par compte, puis appliquées avec un seul
+    `UPDATE ... SET solde = solde + x` par compte, dans l'ordre des
+    identifiants pour que deux transactions verrouillent toujours les comptes
+    dans le même ordre. Les réservations des débits sont ensuite capturées
+    ou libérées.
+    """
+    soldes: dict[int, Decimal] = defaultdict(Decimal)
+    en_attente: dict[int, Decimal] = defaultdict(Decimal)
+    reservations: dict[StatutReservation, list[int]] = defaultdict(list)
+    for operation, valide in decisions:
+        if operation.type_operation == TypeOperation.DEPOT:
+            if valide and operation.compte_destination_id:
+                soldes[operation.compte_destination_id] += operation.montant
+            continue
+        reservations[
+            StatutReservation.CAPTUREE if valide else StatutReservation.LIBEREE
+        ].append(operation.id)
+        if operation.compte_source_id:
+            en_attente[operation.compte_source_id] += operation.montant
+            if valide:
+                soldes[operation.compte_source_id] += operation.montant
+        if valide and operation.compte_destination_id:
+            soldes[operation.compte_destination_id] -= operation.montant
+
+    for compte_id in sorted(soldes.keys() | en_attente.keys()):
+        changes = {}
+        if compte_id in soldes:
+            changes["solde"] = F("solde") + soldes[compte_id]
+        if compte_id in en_attente:
+            changes["solde_en_attente"] = F("solde_en_attente") + en_attente[compte_id]
+        await Compte.filter(id=compte_id).update(**changes)
+
+    for statut, operation_ids in reservations.items():
+        await Reservation.filter(
+            operation_id__in=operation_ids, statut=StatutReservation.ACTIVE
+        ).update(statut=statut, date_cloture=timezone.now())
+
 
 @post_save(Decision)
 async def update_operation(
@@ -186,23 +501,54 @@ async def update_operation(
     using_db: BaseDBAsyncClient | None,
     update_fields: list[str],
 ) -> None:
+    """Applique une nouvelle décision aux comptes, une seule fois par opération.
+
+    L'opération est marquée traitée par un `UPDATE` conditionnel : si une autre
+    décision l'a déjà traitée, une erreur est levée pour annuler la transaction
+    qui crée celle-ci.
+    """
+    if not created:
+        return
     if not instance.operation:
         await instance.fetch_related("operation")
 
-    if instance.operation.type_operation == TypeOperation.DEPOT or not instance.valide:
-        return
+    async with in_transaction("default"):
+        claimed = await Operation.filter(
+            id=instance.operation.id, processed=False
+        ).update(processed=True)
+        if not claimed:
+            raise HTTPException(status_code=400, detail="Operation already validated")
+        await apply_decisions([(instance.operation, bool(instance.valide))])
 
-    await instance.operation.fetch_related("compte_source", "compte_destination")
-    source = instance.operation.compte_source
-    destination = instance.operation.compte_destination
 
-    async with in_transaction():
-        if source:
-            source.solde += instance.operation.montant
-            await source.save()
-        if destination:
-            destination.solde -= instance.operation.montant
-            await destination.save()
+class SoldeInstantane(Model):
+    """Solde d'un compte juste après une décision acceptée.
+
+    Écrit en tâche de fond par `backend.snapshots` : un instantané à
+    l'ouverture du compte, puis un nouveau chaque jour d'activité et toutes
+    les `BALANCE_SNAPSHOT_EVERY` décisions. Le solde à une date se déduit du
+    dernier instantané antérieur et des quelques décisions qui le suivent.
+    """
+
+    id = fields.IntField(primary_key=True, unique=True)
+    compte: fields.ForeignKeyRelation["Compte"] = fields.ForeignKeyField(
+        "models.Compte", related_name="instantanes"
+    )
+    compte_id: int
+    # Dernière décision prise en compte, 0 pour le solde à l'ouverture
+    decision_id = fields.IntField()
+    solde = fields.DecimalField(max_digits=10, decimal_places=2)
+    # Date de cette décision, ou de l'ouverture du compte
+    date_decision = fields.DatetimeField()
+    # Décisions prises en compte depuis l'instantané précédent
+    decisions = fields.IntField(default=0)
+    # Les décisions suivantes ne portent que sur des opérations créées depuis
+    # cette date : elle borne la recherche des décisions à ajouter au solde.
+    debut_operations = fields.DatetimeField()
+
+    class Meta(Model.Meta):
+        unique_together = (("compte_id", "decision_id"),)
+        indexes = (("compte_id", "date_decision"), ("decision_id",))
 
 
 class Log(Model):
@@ -211,3 +557,24 @@ class Log(Model):
     chemin = fields.TextField()
     code_reponse = fields.IntField()
     date_creation = fields.DatetimeField(auto_now_add=True)
+
+    class Meta(Model.Meta):
+        indexes = (("date_creation",), ("ip", "date_creation"))
+
+
+class LogStatistique(Model):
+    """Nombre de requêtes par heure, chemin et code de réponse.
+
+    Alimenté par le compactage des entrées de `Log` plus anciennes que la
+    durée de rétention.
+    """
+
+    id = fields.IntField(primary_key=True, unique=True)
+    heure = fields.DatetimeField()
+    chemin = fields.CharField(max_length=255)
+    code_reponse = fields.IntField()
+    nombre = fields.IntField(default=0)
+
+    class Meta(Model.Meta):
+        unique_together = (("heure", "chemin", "code_reponse"),)
+        indexes = (("chemin", "heure"),)
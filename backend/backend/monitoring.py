@@ -0,0 +1,237 @@
+"""Mesures des requêtes HTTP, des requêtes SQL et de la boucle d'événements.
+
+- Chaque requête HTTP est comptée et chronométrée par route, étiquetée avec
+  le modèle de chemin (`/api/account/{account_id}`) et non le chemin reçu ;
+  les chemins sans route partagent l'étiquette `unmatched`. Pour une réponse
+  en flux, la durée s'arrête à l'envoi des en-têtes.
+- Les méthodes `execute_*` des clients Tortoise sont enveloppées : chaque
+  requête SQL est comptée et chronométrée, et ajoutée au total de la requête
+  HTTP en cours, dont on mesure ainsi le nombre de requêtes SQL et leur durée.
+- L'occupation du pool de connexions est lue au moment de l'export ; le
+  temps d'attente d'une connexion (`backend.db.TimedPool`) est ajouté au
+  total de la requête HTTP en cours.
+- Le retard de la boucle d'événements est le délai entre le moment où une
+  tâche rend la main et celui où elle la reprend, mesuré périodiquement.
+"""
+
+import asyncio
+import contextvars
+import functools
+import time
+import typing
+
+from fastapi import Request, Response
+from tortoise import connections
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.exceptions import ConfigurationError
+
+from backend import metrics
+
+HTTP_REQUESTS = metrics.counter(
+    "http_requests_total",
+    "Requêtes HTTP traitées, par méthode, route et code de réponse.",
+    ("method", "route", "status"),
+)
+HTTP_DURATION = metrics.histogram(
+    "http_request_duration_seconds",
+    "Durée de traitement des requêtes HTTP, par méthode et route.",
+    ("method", "route"),
+)
+HTTP_IN_FLIGHT = metrics.gauge(
+    "http_requests_in_flight", "Requêtes HTTP en cours de traitement."
+)
+HTTP_DB_QUERIES = metrics.histogram(
+    "http_request_db_queries",
+    "Nombre de requêtes SQL par requête HTTP, par route.",
+    ("route",),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+HTTP_DB_DURATION = metrics.histogram(
+    "http_request_db_duration_seconds",
+    "Temps passé en requêtes SQL par requête HTTP, par route.",
+    ("route",),
+)
+HTTP_DB_POOL_WAIT = metrics.histogram(
+    "http_request_db_pool_wait_seconds",
+    "Temps passé à attendre une connexion du pool par requête HTTP, par route.",
+    ("route",),
+)
+DB_QUERIES = metrics.counter(
+    "db_queries_total",
+    "Requêtes SQL exécutées, par connexion et méthode du client Tortoise.",
+    ("connection", "operation"),
+)
+DB_DURATION = metrics.histogram(
+    "db_query_duration_seconds",
+    "Durée des requêtes SQL, attente d'une connexion comprise.",
+    ("operation",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+EVENT_LOOP_LAG = metrics.histogram(
+    "event_loop_lag_seconds",
+    "Retard du réveil d'une tâche endormie, au-delà de la durée demandée.",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+UNMATCHED = "unmatched"
+
+
+class QueryStats:
+    __slots__ = ("count", "duration", "pool_wait")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.pool_wait = 0.0
+
+
+# Statistiques SQL de la requête HTTP en cours ; les tâches de fond n'en ont pas
+_query_stats: contextvars.ContextVar[QueryStats | None] = contextvars.ContextVar(
+    "query_stats", default=None
+)
+# Vrai pendant une requête SQL, pour ne pas compter deux fois une méthode
+# `execute_*` qui en appelle une autre
+_in_query: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "in_query", default=False
+)
+
+_METHODS = (
+    "execute_insert",
+    "execute_query",
+    "execute_query_dict",
+    "execute_many",
+    "execute_script",
+)
+
+
+def _instrument(method: typing.Callable, operation: str) -> typing.Callable:
+    @functools.wraps(method)
+    async def execute(*args, **kwargs):
+        if _in_query.get():
+            return await method(*args, **kwargs)
+        token = _in_query.set(True)
+        start = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            _in_query.reset(token)
+            DB_QUERIES.inc(connection=args[0].connection_name, operation=operation)
+            DB_DURATION.observe(duration, operation=operation)
+            stats = _query_stats.get()
+            if stats is not None:
+                stats.count += 1
+                stats.duration += duration
+
+    execute.__instrumented__ = True  # type: ignore[attr-defined]
+    return execute
+
+
+def _subclasses(cls: type) -> typing.Iterator[type]:
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from _subclasses(subclass)
+
+
+def instrument_database() -> None:
+    """Enveloppe les méthodes `execute_*` des clients Tortoise chargés.
+
+    À appeler une fois Tortoise initialisé, quand les modules des clients
+    (SQLite, MySQL) et de leurs transactions sont importés. Les appels
+    suivants sont sans effet sur les méthodes déjà enveloppées.
+    """
+    for cls in _subclasses(BaseDBAsyncClient):
+        for name in _METHODS:
+            method = cls.__dict__.get(name)
+            if method is None or getattr(method, "__instrumented__", False):
+                continue
+            setattr(cls, name, _instrument(method, name.removeprefix("execute_")))
+
+
+def record_pool_wait(duration: float) -> None:
+    """Ajoute une attente de connexion au total de la requête HTTP en cours."""
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.pool_wait += duration
+
+
+def _pool() -> typing.Any:
+    try:
+        client = connections.get("default")
+    except ConfigurationError:
+        return None
+    return getattr(client, "_pool", None)
+
+
+def _pool_size() -> float:
+    pool = _pool()
+    return pool.size if pool is not None else 0
+
+
+def _pool_in_use() -> float:
+    pool = _pool()
+    return pool.size - pool.freesize if pool is not None else 0
+
+
+def _pool_maxsize() -> float:
+    pool = _pool()
+    return pool.maxsize if pool is not None else 0
+
+
+metrics.gauge(
+    "db_pool_connections",
+    "Connexions ouvertes par le pool de la base de données.",
+    function=_pool_size,
+)
+metrics.gauge(
+    "db_pool_connections_in_use",
+    "Connexions du pool empruntées par une requête ou une transaction.",
+    function=_pool_in_use,
+)
+metrics.gauge(
+    "db_pool_max_connections",
+    "Taille maximale du pool de la base de données.",
+    function=_pool_maxsize,
+)
+
+
+async def monitor_event_loop_lag(interval: float) -> None:
+    """Dort `interval` secondes en boucle et mesure le retard de chaque réveil.
+
+    Le temps écoulé au-delà de `interval` est celui pendant lequel la boucle,
+    occupée par d'autres tâches, n'a pas pu reprendre celle-ci.
+    """
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, time.perf_counter() - start - interval))
+
+
+def _route(request: Request) -> str:
+    route = request.scope.get("route")
+    return getattr(route, "path", UNMATCHED)
+
+
+async def record_request(
+    request: Request, call_next: typing.Callable[[Request], typing.Awaitable[Response]]
+) -> Response:
+    """Middleware : mesure la durée et les requêtes SQL de chaque requête."""
+    stats = QueryStats()
+    token = _query_stats.set(stats)
+    HTTP_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        duration = time.perf_counter() - start
+        HTTP_IN_FLIGHT.dec()
+        _query_stats.reset(token)
+        route = _route(request)
+        HTTP_REQUESTS.inc(method=request.method, route=route, status=str(status_code))
+        HTTP_DURATION.observe(duration, method=request.method, route=route)
+        HTTP_DB_QUERIES.observe(stats.count, route=route)
+        HTTP_DB_DURATION.observe(stats.duration, route=route)
+        HTTP_DB_POOL_WAIT.observe(stats.pool_wait, route=route)
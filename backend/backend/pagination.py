@@ -0,0 +1,29 @@
+"""Pagination par curseur (keyset) sur `(date_creation, id)`.
+
+Le curseur désigne la dernière ligne renvoyée ; la page suivante reprend
+juste après elle. Contrairement à un `OFFSET`, le coût d'une page ne dépend
+pas de sa position dans l'historique.
+"""
+
+import base64
+from datetime import datetime
+
+from fastapi import HTTPException, status
+
+Cursor = tuple[datetime, int]
+
+
+def encode_cursor(date_creation: datetime, id: int) -> str:
+    raw = f"{date_creation.isoformat()}|{id}".encode()
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Décode un curseur, ou lève une erreur HTTP 400 s'il est invalide."""
+    try:
+        date_creation, _, id = base64.urlsafe_b64decode(cursor).decode().partition("|")
+        return datetime.fromisoformat(date_creation), int(id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
@@ -0,0 +1,159 @@
+"""Limitation du débit des requêtes par seaux à jetons.
+
+Chaque client dispose, pour chaque règle de `RATE_LIMITS`, d'un seau de
+`burst` jetons rempli au rythme de `rate` jetons par seconde ; une requête
+consomme un jeton, et reçoit une erreur HTTP 429 avec l'en-tête `Retry-After`
+quand le seau est vide.
+
+Le client est l'utilisateur authentifié quand la requête porte un jeton
+valide, ou des identifiants HTTP Basic déjà vérifiés par une requête
+précédente (`auth.verified_basic`), son adresse IP sinon : le frontend, qui
+relaie les requêtes de tous ses utilisateurs depuis la même adresse avec
+leurs identifiants HTTP Basic, n'est ainsi pas limité dans son ensemble.
+Des identifiants pas encore vérifiés sont comptés pour l'adresse IP, pour
+qu'un client ne puisse pas obtenir un nouveau seau en changeant
+d'identifiant.
+
+La règle appliquée est celle dont le préfixe de chemin est le plus long. Les
+seaux vivent dans le processus (`MemoryBackend`) ; `limiter.backend` peut être
+remplacé par une implémentation partagée entre les workers.
+"""
+
+import abc
+import math
+import time
+import typing
+from collections import OrderedDict
+
+from fastapi import Request, Response, status
+from fastapi.responses import JSONResponse
+
+from backend import metrics
+from backend.auth import decode_token, verified_basic_user
+from backend.settings import RateLimit, settings
+
+RATE_LIMITED = metrics.counter(
+    "rate_limited_requests_total",
+    "Requêtes refusées par la limitation de débit, par règle et type de client.",
+    ("rule", "client"),
+)
+
+
+class RateLimitBackend(abc.ABC):
+    @abc.abstractmethod
+    async def acquire(self, key: str, limit: RateLimit) -> float:
+        """Consomme un jeton du seau `key`.
+
+        Retourne 0 si la requête est admise, sinon le nombre de secondes
+        avant qu'un jeton soit disponible.
+        """
+
+
+class MemoryBackend(RateLimitBackend):
+    """Seaux en mémoire, propres au processus.
+
+    Un seau n'occupe qu'un couple (jetons, date) ; ceux qui n'ont pas servi
+    depuis `idle_timeout` secondes sont supprimés au fil des appels, un
+    seau absent étant équivalent à un seau plein.
+    """
+
+    def __init__(self, idle_timeout: float):
+        self.idle_timeout = idle_timeout
+        self.buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.buckets)
+
+    def _evict_idle(self, now: float) -> None:
+        while self.buckets:
+            key, (_, last) = next(iter(self.buckets.items()))
+            if now - last < self.idle_timeout:
+                return
+            del self.buckets[key]
+
+    async def acquire(self, key: str, limit: RateLimit) -> float:
+        now = time.monotonic()
+        self._evict_idle(now)
+        tokens, last = self.buckets.pop(key, (limit.burst, now))
+        tokens = min(limit.burst, tokens + (now - last) * limit.rate)
+        if tokens >= 1:
+            self.buckets[key] = (tokens - 1, now)
+            return 0
+        self.buckets[key] = (tokens, now)
+        return (1 - tokens) / limit.rate
+
+
+def client_identity(request: Request) -> tuple[str, str]:
+    """Retourne le type de client (`user` ou `ip`) et son identifiant.
+
+    Un jeton d'accès valide, ou des identifiants HTTP Basic déjà vérifiés,
+    donnent le seau de leur utilisateur ; les autres requêtes sont comptées
+    pour l'adresse IP.
+    """
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and credentials:
+        try:
+            return "user", str(decode_token(credentials, "access")["sub"])
+        except Exception:
+            # Le jeton sera refusé par la route ; la limitation ne doit pas
+            # faire échouer la requête
+            pass
+    elif scheme.lower() == "basic" and credentials:
+        user_id = verified_basic_user(credentials)
+        if user_id is not None:
+            return "user", str(user_id)
+    return "ip", request.client.host if request.client else "unknown"
+
+
+class RateLimiter:
+    def __init__(self, backend: RateLimitBackend, rules: dict[str, RateLimit]):
+        self.backend = backend
+        # Les préfixes les plus longs d'abord
+        self.rules = sorted(rules.items(), key=lambda rule: len(rule[0]), reverse=True)
+
+    def rule(self, path: str) -> tuple[str, RateLimit] | None:
+        for prefix, limit in self.rules:
+            if path == prefix or path.startswith(prefix.rstrip("/") + "/"):
+                return prefix, limit
+        return None
+
+    async def check(self, request: Request) -> float:
+        """Retourne 0 si la requête est admise, sinon le délai avant de réessayer."""
+        path = request.url.path
+        if path in settings.RATE_LIMIT_EXCLUDED_PATHS:
+            return 0
+        rule = self.rule(path)
+        if rule is None:
+            return 0
+        prefix, limit = rule
+        client, identity = client_identity(request)
+        retry_after = await self.backend.acquire(f"{prefix}|{client}:{identity}", limit)
+        if retry_after:
+            RATE_LIMITED.inc(rule=prefix, client=client)
+        return retry_after
+
+
+memory_backend = MemoryBackend(idle_timeout=settings.RATE_LIMIT_IDLE_TIMEOUT)
+limiter = RateLimiter(memory_backend, settings.RATE_LIMITS)
+
+metrics.gauge(
+    "rate_limit_buckets",
+    "Seaux de limitation de débit conservés en mémoire.",
+    function=memory_backend.__len__,
+)
+
+
+async def rate_limit(
+    request: Request, call_next: typing.Callable[[Request], typing.Awaitable[Response]]
+) -> Response:
+    """Middleware : refuse la requête avec une erreur 429 si le seau est vide."""
+    if not settings.RATE_LIMIT_ENABLED:
+        return await call_next(request)
+    retry_after = await limiter.check(request)
+    if retry_after:
+        return JSONResponse(
+            {"detail": "Too many requests"},
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+    return await call_next(request)
@@ -1,10 +1,16 @@
-from fastapi import APIRouter
-from tortoise.contrib.pydantic import pydantic_model_creator
+from datetime import datetime
 
-from backend.models import Log
-from backend.routes import account, transaction, user
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from backend import metrics, startup
+from backend.db import use_replica
+from backend.models import Log, LogStatistique
+from backend.routes import account, auth, transaction, user
+from backend.schemas import LogSchema, LogStatistiqueSchema, json_response
 
 api_router = APIRouter(prefix="/api")
+api_router.include_router(auth.router, prefix="/auth", tags=["Auth"])
 api_router.include_router(user.router, prefix="/user", tags=["User"])
 api_router.include_router(account.router, prefix="/account", tags=["Account"])
 api_router.include_router(
@@ -17,8 +23,28 @@ async def ping():
     return "pong"
 
 
-@api_router.get("/logs", response_model=list[pydantic_model_creator(Log)])
-async def get_logs(limit: int = 10, ip: str | None = None) -> list[Log]:
+@api_router.get("/ready")
+async def ready():
+    """Indique si l'application a terminé sa préparation (HTTP 503 sinon)."""
+    if not startup.is_ready():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Not ready"
+        )
+    return "ready"
+
+
+@api_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Expose les métriques du processus au format texte Prometheus."""
+    return PlainTextResponse(
+        metrics.registry.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+@api_router.get(
+    "/logs", response_model=list[LogSchema], dependencies=[Depends(use_replica)]
+)
+async def get_logs(limit: int = 10, ip: str | None = None):
     """Obtiens les logs les plus récents.
 
     Parameters
@@ -31,10 +57,48 @@ async def get_logs(limit: int = 10, ip: str | None = None) -> list[Log]:
     -------
     Retourne la liste des logs
     """
+    limit = min(limit, 100)
     op = Log.all().limit(limit).order_by("-date_creation")
-    if limit > 100:
-        limit = 100
     if ip:
         op = op.filter(ip=ip)
     logs = await op
-    return logs
+    return json_response(list[LogSchema], logs)
+
+
+@api_router.get(
+    "/logs/stats",
+    response_model=list[LogStatistiqueSchema],
+    dependencies=[Depends(use_replica)],
+)
+async def get_logs_stats(
+    debut: datetime | None = None,
+    fin: datetime | None = None,
+    chemin: str | None = None,
+    code_reponse: int | None = None,
+    limit: int = 100,
+):
+    """Obtiens les statistiques horaires des logs compactés.
+
+    Les logs plus anciens que la durée de rétention sont regroupés par heure,
+    chemin et code de réponse.
+
+    Parameters
+    ----------
+    debut, fin : datetime, optionnel
+
+        Bornes de l'intervalle, sur l'heure de début de chaque statistique
+
+    limit : int, optionnel
+
+        Le nombre de lignes à récupérer, limité à 1000, par défaut 100
+    """
+    op = LogStatistique.all().order_by("-heure").limit(min(limit, 1000))
+    if debut:
+        op = op.filter(heure__gte=debut)
+    if fin:
+        op = op.filter(heure__lt=fin)
+    if chemin:
+        op = op.filter(chemin=chemin)
+    if code_reponse:
+        op = op.filter(code_reponse=code_reponse)
+    return json_response(list[LogStatistiqueSchema], await op)
@@ -1,47 +1,102 @@
-from typing import Annotated
+from datetime import datetime
+from decimal import Decimal
+from typing import Annotated, Literal
 
 import pydantic
-from fastapi import APIRouter, HTTPException, Response, status
-from tortoise.contrib.pydantic import pydantic_model_creator
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from tortoise import timezone
 from tortoise.exceptions import IntegrityError
 
-from backend.auth import CurrentUser
+from backend import snapshots, statement
+from backend.auth import CurrentUser, revoke_user_tokens
+from backend.db import use_replica
 from backend.models import Compte, Operation, TypeCompte, ValidationCompte
+from backend.pagination import decode_cursor, encode_cursor
+from backend.schemas import (
+    CompteSchema,
+    OperationSchema,
+    ValidationCompteSchema,
+    json_response,
+)
 
 router = APIRouter()
 
 
 class ListAccountsResponse(pydantic.BaseModel):
-    account: Annotated[Compte, pydantic_model_creator(Compte)]
-    validation: (
-        Annotated[ValidationCompte, pydantic_model_creator(ValidationCompte)] | None
-    )
+    account: CompteSchema
+    validation: ValidationCompteSchema | None
+    # Solde moins les débits en attente (`account.solde_en_attente`)
+    solde_disponible: Decimal
+
+
+ACCOUNT_FIELDS = (
+    "id",
+    "iban",
+    "type_compte",
+    "solde",
+    "solde_en_attente",
+    "date_creation",
+)
+VALIDATION_FIELDS = ("id", "valide", "date_validation")
+
+# Construisent les objets des schémas depuis les lignes lues en base
+account_schema: pydantic.TypeAdapter[Compte] = pydantic.TypeAdapter(CompteSchema)
+validation_schema: pydantic.TypeAdapter[ValidationCompte] = pydantic.TypeAdapter(
+    ValidationCompteSchema
+)
+
+
+@router.get(
+    "",
+    response_model=list[ListAccountsResponse],
+    dependencies=[Depends(use_replica)],
+)
+async def list_accounts(user: CurrentUser):
+    """Liste tous les comptes utilisateurs créés.
 
+    Les comptes, leur validation et leur solde disponible sont lus en une
+    seule requête, par une jointure externe sur les validations.
+    """
+    rows = (
+        await Compte.filter(utilisateur=user)
+        .order_by("id", "-validation__id")
+        .values(
+            *ACCOUNT_FIELDS,
+            *(f"validation__{field}" for field in VALIDATION_FIELDS),
+        )
+    )
 
-@router.get("", response_model=list[ListAccountsResponse])
-async def list_accounts(user: CurrentUser):
-    """Liste tous les comptes utilisateurs créés."""
-    accounts = await Compte.filter(utilisateur=user)
-    accounts_ids = [str(account.id) for account in accounts]
-    validations = await ValidationCompte.in_bulk(accounts_ids, field_name="compte_id")
-
-    return [
-        ListAccountsResponse(
-            account=account,
-            validation=validations.get(
-                account.id  # pyright: ignore[reportArgumentType]
+    accounts: dict[int, ListAccountsResponse] = {}
+    for row in rows:
+        if row["id"] in accounts:
+            # Plusieurs validations : seule la plus récente est retournée
+            continue
+        validation = {field: row[f"validation__{field}"] for field in VALIDATION_FIELDS}
+        accounts[row["id"]] = ListAccountsResponse(
+            account=account_schema.validate_python(
+                {field: row[field] for field in ACCOUNT_FIELDS}
             ),
+            validation=(
+                validation_schema.validate_python(validation)
+                if validation["id"] is not None
+                else None
+            ),
+            solde_disponible=row["solde"] - row["solde_en_attente"],
         )
-        for account in accounts
-    ]
+    return json_response(list[ListAccountsResponse], list(accounts.values()))
 
 
-@router.get("/tovalidate", response_model=list[pydantic_model_creator(Compte)])
+@router.get(
+    "/tovalidate",
+    response_model=list[CompteSchema],
+    dependencies=[Depends(use_replica)],
+)
 async def list_accounts_to_validate(user: CurrentUser):
     """Liste tous les comptes utilisateurs à valider."""
     user.can_authorize()
     accounts = await Compte.filter(validation=None)
-    return accounts
+    return json_response(list[CompteSchema], accounts)
 
 
 class CreateAccountPayload(pydantic.BaseModel):
@@ -51,7 +106,7 @@ class CreateAccountPayload(pydantic.BaseModel):
     solde_initial: float = 0.0
 
 
-@router.post("", response_model=pydantic_model_creator(Compte))
+@router.post("", response_model=CompteSchema)
 async def create_account(user: CurrentUser, payload: CreateAccountPayload):
     """Crée un nouveeau compte en fonction des paramètres donnés.
 
@@ -75,29 +130,117 @@ async def create_account(user: CurrentUser, payload: CreateAccountPayload):
 class GetAccountResponse(pydantic.BaseModel):
     """Modèle de réponse pour la récupération d'un compte utilisateur."""
 
-    account: Annotated[Compte, pydantic_model_creator(Compte)]
-    operations: list[Annotated[Operation, pydantic_model_creator(Operation)]]
-    validation: (
-        Annotated[ValidationCompte, pydantic_model_creator(ValidationCompte)] | None
-    )
-
-
-@router.get("/{account_id}", response_model=GetAccountResponse)
-async def get_account(account_id: int, user: CurrentUser):
+    account: CompteSchema
+    operations: list[OperationSchema]
+    validation: ValidationCompteSchema | None
+    next_cursor: str | None
+
+
+@router.get(
+    "/{account_id}",
+    response_model=GetAccountResponse,
+    dependencies=[Depends(use_replica)],
+)
+async def get_account(
+    account_id: int,
+    user: CurrentUser,
+    limit: int = 50,
+    cursor: str | None = None,
+    debut: datetime | None = None,
+    fin: datetime | None = None,
+):
     """Récupère un compte utilisateur spécifique.
 
     Retourne une liste d'information avec le compte, ses opérations, et son status de validation.
 
     Si la validation est "null", la validation n'a pas encore eu lieu.
+
+    Les opérations sont paginées, des plus récentes aux plus anciennes, par
+    pages de `limit` (200 au plus). Tant qu'il en reste, `next_cursor` est à
+    passer en paramètre `cursor` pour obtenir la page suivante. `debut` et
+    `fin` bornent l'intervalle de dates.
+    """
+    limit = max(1, min(limit, 200))
+    after = decode_cursor(cursor) if cursor else None
+    account = await Compte.get_user_account(account_id, user)
+    validation = await ValidationCompte.filter(compte=account).order_by("-id").first()
+
+    operations = await Operation.page_by_account(
+        account, limit + 1, after=after, debut=debut, fin=fin
+    )
+    next_cursor = None
+    if len(operations) > limit:
+        operations = operations[:limit]
+        last = operations[-1]
+        next_cursor = encode_cursor(last.date_creation, last.id)
+
+    return json_response(
+        GetAccountResponse,
+        {
+            "account": account,
+            "operations": operations,
+            "validation": validation,
+            "next_cursor": next_cursor,
+        },
+    )
+
+
+@router.get("/{account_id}/statement")
+async def get_statement(
+    account_id: int,
+    user: CurrentUser,
+    format: Literal["csv", "ndjson"] = "csv",
+    debut: Annotated[datetime | None, Query(alias="from")] = None,
+    fin: Annotated[datetime | None, Query(alias="to")] = None,
+):
+    """Exporte le relevé d'un compte, en CSV ou en NDJSON.
+
+    Les opérations entre `from` (inclus) et `to` (exclu) sont envoyées au fil
+    de l'eau, de la plus ancienne à la plus récente, avec le solde du compte
+    après chacune d'elles.
     """
     account = await Compte.get_user_account(account_id, user)
-    validation = await ValidationCompte.filter(compte=account).get_or_none()
+    if format == "csv":
+        content, media_type = statement.csv_lines(account, debut, fin), "text/csv"
+    else:
+        content, media_type = (
+            statement.ndjson_lines(account, debut, fin),
+            "application/x-ndjson",
+        )
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="releve-{account.iban}.{format}"'
+            )
+        },
+    )
 
-    return {
-        "account": account,
-        "operations": await account.get_all_operations(True),
-        "validation": validation,
-    }
+
+class BalanceResponse(pydantic.BaseModel):
+    account_id: int
+    date: datetime
+    solde: Decimal
+
+
+@router.get(
+    "/{account_id}/balance",
+    response_model=BalanceResponse,
+    dependencies=[Depends(use_replica)],
+)
+async def get_balance(account_id: int, user: CurrentUser, at: datetime | None = None):
+    """Solde d'un compte à la date `at` (maintenant par défaut).
+
+    Le solde est lu dans le dernier instantané antérieur à cette date, plus
+    les décisions acceptées entre les deux : le coût ne dépend pas de la
+    longueur de l'historique.
+    """
+    account = await Compte.get_user_account(account_id, user)
+    at = at or timezone.now()
+    return BalanceResponse(
+        account_id=account.id, date=at, solde=await snapshots.balance_at(account, at)
+    )
 
 
 class AuthorizeAccountPayload(pydantic.BaseModel):
@@ -126,4 +269,5 @@ async def authorize_account(
 async def delete_user(user: CurrentUser):
     """Supprime le compte utilisateur connecté."""
     await user.delete()
+    revoke_user_tokens(user)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,89 @@
+from typing import Annotated
+
+import pydantic
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.security import HTTPAuthorizationCredentials
+
+from backend.auth import (
+    authenticate,
+    bearer_scheme,
+    create_token,
+    decode_token,
+    revoke_token,
+)
+from backend.models import Utilisateur
+from backend.settings import settings
+
+router = APIRouter()
+
+
+class LoginPayload(pydantic.BaseModel):
+    """Payload pour l'ouverture d'une session."""
+
+    email: str
+    mot_de_passe: str
+
+
+class RefreshPayload(pydantic.BaseModel):
+    """Payload pour le renouvellement ou la révocation d'une session."""
+
+    refresh_token: str
+
+
+class TokenResponse(pydantic.BaseModel):
+    access_token: str
+    refresh_token: str
+    token_type: str = "bearer"
+    expires_in: int
+
+
+def issue_tokens(user: Utilisateur) -> TokenResponse:
+    return TokenResponse(
+        access_token=create_token(user, "access"),
+        refresh_token=create_token(user, "refresh"),
+        expires_in=settings.ACCESS_TOKEN_TTL,
+    )
+
+
+@router.post("/token", response_model=TokenResponse)
+async def login(payload: LoginPayload):
+    """Vérifie le mot de passe une seule fois et délivre une paire de jetons.
+
+    Le jeton d'accès s'utilise ensuite avec l'en-tête `Authorization: Bearer`.
+    """
+    user = await authenticate(payload.email, payload.mot_de_passe)
+    return issue_tokens(user)
+
+
+@router.post("/refresh", response_model=TokenResponse)
+async def refresh(payload: RefreshPayload):
+    """Échange un jeton de renouvellement contre une nouvelle paire de jetons.
+
+    L'ancien jeton de renouvellement est révoqué.
+    """
+    claims = decode_token(payload.refresh_token, "refresh")
+    revoke_token(claims)
+    user = await Utilisateur.get_or_none(id=claims["sub"])
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token"
+        )
+    return issue_tokens(user)
+
+
+@router.post("/logout", response_model=None)
+async def logout(
+    bearer: Annotated[HTTPAuthorizationCredentials | None, Depends(bearer_scheme)],
+    payload: RefreshPayload | None = None,
+):
+    """Révoque le jeton d'accès utilisé, et le jeton de renouvellement si fourni."""
+    if not bearer:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    revoke_token(decode_token(bearer.credentials, "access"))
+    if payload:
+        revoke_token(decode_token(payload.refresh_token, "refresh"))
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -1,26 +1,39 @@
+import typing
 from decimal import Decimal
-from typing import Annotated
+from typing import Literal
 
 import pydantic
-from fastapi import APIRouter, HTTPException, status
-from tortoise.contrib.pydantic import pydantic_model_creator
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.exceptions import RequestValidationError
+from tortoise.functions import Max
 from tortoise.transactions import in_transaction
 
 from backend.auth import CurrentUser
-from backend.models import Compte, Decision, Operation, TypeOperation
+from backend.db import use_replica
+from backend.idempotency import IdempotentRoute
+from backend.models import (
+    Compte,
+    Decision,
+    Operation,
+    Reservation,
+    TypeOperation,
+    apply_decisions,
+    validation_cache,
+)
+from backend.schemas import OperationSchema
 
-router = APIRouter()
+router = APIRouter(route_class=IdempotentRoute)
 
 
 class CreateOperationOnlyAmountPayload(pydantic.BaseModel):
     """Payload pour la création d'une opération."""
 
-    montant: float
+    montant: Decimal
 
 
 @router.post(
     "/{account_id}/depot",
-    response_model=Annotated[Operation, pydantic_model_creator(Operation)],
+    response_model=OperationSchema,
 )
 async def create_deposit_operation(
     account_id: int, user: CurrentUser, payload: CreateOperationOnlyAmountPayload
@@ -42,26 +55,23 @@ async def create_deposit_operation(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Amount must be positive"
         )
 
-    async with in_transaction():
+    async with in_transaction("default"):
         operation = await Operation.create(
             type_operation=TypeOperation.DEPOT,
             compte_source=None,
             compte_destination=account,
             montant=payload.montant,
         )
+        # Le signal `update_operation` crédite le compte
         await Decision.create(operation=operation, valide=True, agent=None)
-        operation.processed = True
-        await operation.save()
-
-        account.solde += Decimal(payload.montant)
-        await account.save()
+    operation.processed = True
 
     return operation
 
 
 @router.post(
     "/{account_id}/retrait",
-    response_model=Annotated[Operation, pydantic_model_creator(Operation)],
+    response_model=OperationSchema,
 )
 async def create_withdrawal_operation(
     account_id: int, user: CurrentUser, payload: CreateOperationOnlyAmountPayload
@@ -73,21 +83,21 @@ async def create_withdrawal_operation(
 
     account = await Compte.get_user_account(account_id, user)
     await account.ensure_validated()
-    balance = await account.get_allowed_balance()
 
-    if balance < payload.montant:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient balance"
-        )
-
-    async with in_transaction():
+    async with in_transaction("default"):
+        if not await account.reserve(payload.montant):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient balance"
+            )
         operation = await Operation.create(
             type_operation=TypeOperation.RETRAIT,
             compte_source=account,
             compte_destination=None,
             montant=-payload.montant,
         )
-        account.solde -= Decimal(payload.montant)
+        await Reservation.create(
+            compte=account, operation=operation, montant=payload.montant
+        )
     return operation
 
 
@@ -95,12 +105,12 @@ class CreateOperationVirementPayload(pydantic.BaseModel):
     """Payload pour la création d'une opération vers un compte."""
 
     target: int
-    montant: float
+    montant: Decimal
 
 
 @router.post(
     "/{account_id}/virement",
-    response_model=Annotated[Operation, pydantic_model_creator(Operation)],
+    response_model=OperationSchema,
 )
 async def create_virement(
     account_id: int, user: CurrentUser, payload: CreateOperationVirementPayload
@@ -130,13 +140,6 @@ async def create_virement(
         exception.detail += " (Account: source)"
         raise exception
 
-    balance = await account.get_allowed_balance()
-
-    if balance < payload.montant:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient balance"
-        )
-
     compte_reception = await Compte.filter(id=payload.target).first()
     if not compte_reception:
         raise HTTPException(
@@ -149,21 +152,228 @@ async def create_virement(
         exception.detail += " (Account: destination)"
         raise exception
 
-    async with in_transaction():
+    async with in_transaction("default"):
+        if not await account.reserve(payload.montant):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient balance"
+            )
         operation = await Operation.create(
             type_operation=TypeOperation.VIREMENT,
             compte_source=account,
             compte_destination=compte_reception,
             montant=-payload.montant,
         )
+        await Reservation.create(
+            compte=account, operation=operation, montant=payload.montant
+        )
 
     return operation
 
 
-@router.get("/tovalidate")
+MAX_VIREMENTS = 1000
+# Virements d'un flux NDJSON dont les comptes destinataires sont vérifiés
+# ensemble, au fil de la lecture
+NDJSON_CHUNK_SIZE = 200
+
+
+class BatchVirementPayload(pydantic.BaseModel):
+    virements: list[CreateOperationVirementPayload] = pydantic.Field(
+        max_length=MAX_VIREMENTS
+    )
+
+
+class VirementResult(pydantic.BaseModel):
+    # Position du virement dans la requête, à partir de 0
+    index: int
+    status: Literal["created", "rejected"]
+    # Identifiant de l'opération créée
+    id: int | None = None
+    detail: str | None = None
+
+
+def _validation_error(
+    error: pydantic.ValidationError, *loc: typing.Any
+) -> RequestValidationError:
+    return RequestValidationError(
+        [
+            {**detail, "loc": ("body", *loc, *detail["loc"])}
+            for detail in error.errors(include_url=False)
+        ]
+    )
+
+
+async def _ndjson_lines(request: Request) -> typing.AsyncIterator[bytes]:
+    """Lignes non vides du corps de la requête, lues au fil de l'eau."""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+async def read_virements(
+    request: Request,
+) -> typing.AsyncIterator[list[CreateOperationVirementPayload]]:
+    """Virements du corps de la requête, par lots, en JSON ou en NDJSON.
+
+    Un corps JSON est lu et validé en entier, et forme un seul lot. En NDJSON
+    (`Content-Type: application/x-ndjson`), une ligne par virement : chaque
+    ligne est validée dès sa lecture, les virements sont remis par lots de
+    `NDJSON_CHUNK_SIZE` et le corps n'est pas conservé ; le flux est refusé
+    dès qu'il dépasse `MAX_VIREMENTS` virements.
+    """
+    content_type = request.headers.get("Content-Type", "").partition(";")[0]
+    if content_type.strip() != "application/x-ndjson":
+        try:
+            payload = BatchVirementPayload.model_validate_json(await request.body())
+        except pydantic.ValidationError as error:
+            raise _validation_error(error) from None
+        yield payload.virements
+        return
+
+    count = 0
+    chunk: list[CreateOperationVirementPayload] = []
+    async for line in _ndjson_lines(request):
+        if count >= MAX_VIREMENTS:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Too many transfers (at most {MAX_VIREMENTS})",
+            )
+        try:
+            chunk.append(CreateOperationVirementPayload.model_validate_json(line))
+        except pydantic.ValidationError as error:
+            raise _validation_error(error, count) from None
+        count += 1
+        if len(chunk) >= NDJSON_CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def _targets_status(targets: set[int]) -> dict[int, bool | None]:
+    """Statut de validation des comptes destinataires qui existent.
+
+    Une seule requête pour tous les comptes, qui alimente aussi le cache des
+    statuts de validation.
+    """
+    rows = (
+        await Compte.filter(id__in=targets)
+        .order_by("id", "-validation__id")
+        .values_list("id", "validation__valide")
+    )
+    statuses: dict[int, bool | None] = {}
+    for compte_id, valide in rows:
+        # Plusieurs validations : seule la plus récente compte
+        if compte_id not in statuses:
+            statuses[compte_id] = valide
+            validation_cache.set(compte_id, valide)
+    return statuses
+
+
+@router.post("/{account_id}/virements", response_model=list[VirementResult])
+async def create_virements(account_id: int, user: CurrentUser, request: Request):
+    """Crée plusieurs virements depuis un même compte, par exemple une paie.
+
+    Le corps est un objet `{"virements": [{"target": ..., "montant": ...}]}`,
+    ou un flux NDJSON d'objets `{"target": ..., "montant": ...}`, au plus
+    `MAX_VIREMENTS`.
+
+    Les comptes destinataires de chaque lot lu sont vérifiés en une seule
+    requête ; les virements invalides sont refusés, sans interrompre le lot.
+    Seuls le destinataire et le montant des virements acceptés sont
+    conservés jusqu'à la fin de la lecture. Les fonds sont alors réservés
+    une seule fois pour leur total, et tous sont créés en une insertion, ou
+    aucun si le solde est insuffisant (HTTP 400). Un résultat est retourné
+    pour chaque virement, dans l'ordre de la requête.
+    """
+    account = await Compte.get_user_account(account_id, user)
+    try:
+        await account.ensure_validated()
+    except HTTPException as exception:
+        exception.detail += " (Account: source)"
+        raise exception
+
+    results: list[VirementResult] = []
+    # Virements acceptés : résultat, compte destinataire et montant
+    accepted: list[tuple[VirementResult, int, Decimal]] = []
+    async for virements in read_virements(request):
+        statuses = await _targets_status(
+            {virement.target for virement in virements if virement.target != account_id}
+        )
+        for virement in virements:
+            result = VirementResult(index=len(results), status="rejected")
+            results.append(result)
+            if virement.montant <= 0:
+                result.detail = "Amount must be positive"
+            elif virement.target == account_id:
+                result.detail = "Cannot transfer to the same account"
+            elif virement.target not in statuses:
+                result.detail = "Destination account not found"
+            elif statuses[virement.target] is None:
+                result.detail = "Account not yet validated. (Account: destination)"
+            elif not statuses[virement.target]:
+                result.detail = "Account not validated. (Account: destination)"
+            else:
+                accepted.append((result, virement.target, virement.montant))
+    if not accepted:
+        return results
+
+    async with in_transaction("default"):
+        total = sum((montant for _, _, montant in accepted), Decimal(0))
+        if not await account.reserve(total):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient balance"
+            )
+        # La réservation verrouille le compte jusqu'à la fin de la transaction,
+        # et tout débit du compte commence par une réservation : aucune autre
+        # opération de ce compte ne peut être créée entre-temps. Celles du lot
+        # sont donc ses opérations d'identifiant supérieur au plus grand lu
+        # avant l'insertion, `bulk_create` ne retournant pas les identifiants.
+        row = await Operation.annotate(last_id=Max("id")).first().values("last_id")
+        last_id = row["last_id"] if row and row["last_id"] is not None else 0
+        await Operation.bulk_create(
+            [
+                Operation(
+                    type_operation=TypeOperation.VIREMENT,
+                    compte_source=account,
+                    compte_destination_id=target,
+                    montant=-montant,
+                )
+                for _, target, montant in accepted
+            ]
+        )
+        operation_ids: list[int] = [
+            row["id"]
+            for row in await Operation.filter(compte_source=account, id__gt=last_id)
+            .order_by("id")
+            .values("id")
+        ]
+        await Reservation.bulk_create(
+            [
+                Reservation(compte=account, operation_id=operation_id, montant=montant)
+                for operation_id, (_, _, montant) in zip(
+                    operation_ids, accepted, strict=True
+                )
+            ]
+        )
+
+    for operation_id, (result, _, _) in zip(operation_ids, accepted):
+        result.status = "created"
+        result.id = operation_id
+    return results
+
+
+@router.get("/tovalidate", dependencies=[Depends(use_replica)])
 async def list_operations_to_validate(user: CurrentUser):
     user.can_authorize()
-    virements = await Operation.filter(decision=None).prefetch_related(
+    # Les comptes sont joints dans la même requête ; le frontend lit leur IBAN
+    # dans `_compte_source` et `_compte_destination`
+    virements = await Operation.filter(processed=False).select_related(
         "compte_source", "compte_destination"
     )
     return [virement.__dict__ for virement in virements]
@@ -191,9 +401,92 @@ async def validate_operation(
             detail="Operation already validated",
         )
 
-    async with in_transaction():
+    async with in_transaction("default"):
+        # Le signal `update_operation` applique la décision aux comptes
         await Decision.create(operation=operation, valide=payload.authorize, agent=user)
-        operation.processed = True
-        await operation.save()
+    operation.processed = True
 
     return operation
+
+
+class OperationDecisionPayload(pydantic.BaseModel):
+    id: int
+    authorize: bool
+
+
+class BulkAuthorizeOperationPayload(pydantic.BaseModel):
+    decisions: list[OperationDecisionPayload] = pydantic.Field(max_length=1000)
+
+
+class OperationDecisionResult(pydantic.BaseModel):
+    id: int
+    status: Literal["applied", "skipped", "not_found"]
+    detail: str | None = None
+
+
+@router.post("/validate", response_model=list[OperationDecisionResult])
+async def validate_operations(
+    payload: BulkAuthorizeOperationPayload, user: CurrentUser
+):
+    """Valide ou refuse plusieurs opérations en une seule transaction.
+
+    Les opérations déjà traitées, ou demandées plusieurs fois, sont ignorées
+    sans interrompre le lot. Un résultat est retourné pour chaque élément, dans
+    l'ordre de la requête.
+    """
+    user.can_authorize()
+
+    results: list[OperationDecisionResult] = []
+    async with in_transaction("default"):
+        operations = {
+            operation.id: operation
+            for operation in await Operation.filter(
+                id__in={decision.id for decision in payload.decisions}
+            ).select_for_update()
+        }
+        to_apply: list[tuple[Operation, bool]] = []
+        seen: set[int] = set()
+        for decision in payload.decisions:
+            operation = operations.get(decision.id)
+            if not operation:
+                results.append(
+                    OperationDecisionResult(
+                        id=decision.id, status="not_found", detail="Operation not found"
+                    )
+                )
+            elif decision.id in seen:
+                results.append(
+                    OperationDecisionResult(
+                        id=decision.id,
+                        status="skipped",
+                        detail="Operation listed more than once",
+                    )
+                )
+            elif operation.processed:
+                results.append(
+                    OperationDecisionResult(
+                        id=decision.id,
+                        status="skipped",
+                        detail="Operation already validated",
+                    )
+                )
+            else:
+                to_apply.append((operation, decision.authorize))
+                results.append(
+                    OperationDecisionResult(id=decision.id, status="applied")
+                )
+            seen.add(decision.id)
+
+        if to_apply:
+            await Decision.bulk_create(
+                [
+                    Decision(operation=operation, valide=authorize, agent=user)
+                    for operation, authorize in to_apply
+                ]
+            )
+            await Operation.filter(
+                id__in=[operation.id for operation, _ in to_apply], processed=False
+            ).update(processed=True)
+            await apply_decisions(to_apply)
+
+    return results
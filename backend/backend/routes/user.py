@@ -1,11 +1,9 @@
-from typing import Annotated
-
 import pydantic
-from fastapi import APIRouter, HTTPException, Response, status
-from tortoise.contrib.pydantic import pydantic_model_creator
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from tortoise.exceptions import IntegrityError
 
-from backend.auth import CurrentUser
+from backend.auth import CurrentUser, revoke_user_tokens
+from backend.db import use_replica
 from backend.models import (
     Compte,
     Operation,
@@ -14,15 +12,25 @@ from backend.models import (
     Utilisateur,
     ValidationCompte,
 )
+from backend.schemas import (
+    CompteSchema,
+    OperationSchema,
+    UtilisateurSchema,
+    json_response,
+)
 
 router = APIRouter()
 
 
-@router.get("", response_model=list[pydantic_model_creator(Utilisateur)])
+@router.get(
+    "",
+    response_model=list[UtilisateurSchema],
+    dependencies=[Depends(use_replica)],
+)
 async def list_users():
     """Liste tous les utilisateurs créés."""
     users = await Utilisateur.all()
-    return users
+    return json_response(list[UtilisateurSchema], users)
 
 
 class CreateUserPayload(pydantic.BaseModel):
@@ -35,8 +43,8 @@ class CreateUserPayload(pydantic.BaseModel):
 
 
 class CreateUserResponse(pydantic.BaseModel):
-    user: Annotated[Utilisateur, pydantic_model_creator(Utilisateur)]
-    account: Annotated[Compte, pydantic_model_creator(Compte)] | None
+    user: UtilisateurSchema
+    account: CompteSchema | None
 
 
 @router.post("", response_model=CreateUserResponse)
@@ -65,29 +73,25 @@ async def create_user(payload: CreateUserPayload):
         )
 
 
-@router.get("/me", response_model=pydantic_model_creator(Utilisateur))
+@router.get("/me", response_model=UtilisateurSchema)
 async def get_user(user: CurrentUser):
     return user
 
 
 @router.get(
     "/me/recent",
-    response_model=dict[str, list[pydantic_model_creator(Operation)]],
+    response_model=dict[str, list[OperationSchema]],
+    dependencies=[Depends(use_replica)],
 )
 async def get_recent_operations(user: CurrentUser, limit: int = 5):
-    await user.fetch_related("comptes")
-    operations: dict[str, list[Operation]] = {}
-    for compte in user.comptes:
-        operations[compte.iban] = (
-            await Operation.filter_by_account(compte)
-            .limit(limit)
-            .order_by("-date_creation")
-        )
-    return operations
+    return json_response(
+        dict[str, list[OperationSchema]], await Operation.recent_by_user(user, limit)
+    )
 
 
 @router.delete("/me", response_model=None)
 async def delete_user(user: CurrentUser):
     """Supprime le utilisateur connecté."""
     await user.delete()
+    revoke_user_tokens(user)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,131 @@
+"""Modèles de réponse et sérialisation JSON directe.
+
+Chaque modèle Tortoise n'est converti en modèle Pydantic qu'une seule fois,
+ici, puis réutilisé par toutes les routes.
+
+`json_response` sérialise une réponse en octets avec `orjson`, qui encode
+nativement `datetime` et les énumérations, au lieu du chemin par défaut de
+FastAPI (validation du `response_model`, conversion en objets Python simples
+par `jsonable_encoder`, puis `json.dumps`). Pour chaque type de réponse, un
+encodeur qui ne lit que les champs du modèle Pydantic est construit une
+seule fois. Le JSON produit est identique, mais la réponse n'est pas
+revalidée : le contenu doit déjà correspondre au type.
+"""
+
+import decimal
+import functools
+import types
+import typing
+
+import orjson
+import pydantic
+from fastapi import Response
+from tortoise.contrib.pydantic import pydantic_model_creator
+
+from backend.models import (
+    Compte,
+    Log,
+    LogStatistique,
+    Operation,
+    Utilisateur,
+    ValidationCompte,
+)
+
+UtilisateurSchema = typing.Annotated[Utilisateur, pydantic_model_creator(Utilisateur)]
+CompteSchema = typing.Annotated[Compte, pydantic_model_creator(Compte)]
+ValidationCompteSchema = typing.Annotated[
+    ValidationCompte, pydantic_model_creator(ValidationCompte)
+]
+OperationSchema = typing.Annotated[Operation, pydantic_model_creator(Operation)]
+LogSchema = typing.Annotated[Log, pydantic_model_creator(Log)]
+LogStatistiqueSchema = typing.Annotated[
+    LogStatistique, pydantic_model_creator(LogStatistique)
+]
+
+Encoder = typing.Callable[[typing.Any], typing.Any]
+
+
+def _model_encoder(model: type[pydantic.BaseModel]) -> Encoder:
+    names = tuple(model.model_fields)
+    nested = [
+        (name, encode)
+        for name, field in model.model_fields.items()
+        if (encode := encoder(field.rebuild_annotation())) is not None
+    ]
+
+    def encode_model(value: typing.Any) -> dict[str, typing.Any]:
+        if isinstance(value, dict):
+            data = {name: value[name] for name in names}
+        else:
+            data = {name: getattr(value, name) for name in names}
+        for name, encode in nested:
+            data[name] = encode(data[name])
+        return data
+
+    return encode_model
+
+
+@functools.cache
+def encoder(type_: typing.Any) -> Encoder | None:
+    """Construit la fonction qui réduit une valeur de type `type_` aux types
+    qu'`orjson` sait encoder, ou `None` si la valeur peut être encodée telle
+    quelle.
+
+    Les objets Tortoise et Pydantic, comme les dictionnaires, sont réduits
+    aux champs du modèle Pydantic correspondant.
+    """
+    origin = typing.get_origin(type_)
+    args = typing.get_args(type_)
+    if origin is typing.Annotated:
+        for metadata in args[1:]:
+            if isinstance(metadata, type) and issubclass(metadata, pydantic.BaseModel):
+                return encoder(metadata)
+        return encoder(args[0])
+    if origin is list:
+        item = encoder(args[0])
+        if item is None:
+            return None
+        return lambda value: [item(element) for element in value]
+    if origin is dict:
+        item = encoder(args[1])
+        if item is None:
+            return None
+        return lambda value: {key: item(element) for key, element in value.items()}
+    if origin in (typing.Union, types.UnionType):
+        options = [arg for arg in args if arg is not type(None)]
+        item = encoder(options[0]) if len(options) == 1 else None
+        if item is None:
+            return None
+        return lambda value: None if value is None else item(value)
+    if isinstance(type_, type) and issubclass(type_, pydantic.BaseModel):
+        return _model_encoder(type_)
+    return None
+
+
+def _default(value: typing.Any) -> typing.Any:
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dump_json(type_: typing.Any, content: typing.Any) -> bytes:
+    """Sérialise `content`, objets Tortoise compris, selon le type `type_`."""
+    encode = encoder(type_)
+    if encode is not None:
+        content = encode(content)
+    return orjson.dumps(content, default=_default, option=orjson.OPT_UTC_Z)
+
+
+def json_response(
+    type_: typing.Any, content: typing.Any, status_code: int = 200
+) -> Response:
+    """Réponse JSON sérialisée directement en octets selon le type `type_`.
+
+    La route doit garder `response_model=type_` pour la documentation
+    OpenAPI : FastAPI ne resérialise pas une `Response` déjà construite.
+    """
+    return Response(
+        content=dump_json(type_, content),
+        status_code=status_code,
+        media_type="application/json",
+    )
@@ -1,10 +1,101 @@
-from pydantic import Field
+import os
+import secrets
+from typing import Literal
+
+from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+class RateLimit(BaseModel):
+    """Seau à jetons : `rate` jetons par seconde, au plus `burst` en réserve."""
+
+    rate: float = Field(gt=0)
+    burst: int = Field(ge=1)
+
+
 class Settings(BaseSettings):
     # Voir https://tortoise.github.io/databases.html
     DB_URL: str = Field(validation_alias="DB_URL")
+    # Réplica en lecture seule, utilisé par les routes de consultation
+    DB_REPLICA_URL: str | None = None
+    # Applique les migrations au démarrage. En production, elles sont
+    # appliquées avant de lancer le serveur (`python -m backend.migrations
+    # upgrade`), et le démarrage vérifie seulement qu'il n'en reste aucune.
+    MIGRATE_ON_STARTUP: bool = True
+    # Pool de connexions MySQL : taille, durée de vie d'une connexion en
+    # secondes (-1 : illimitée), et attente maximale d'une connexion libre
+    # avant de répondre 503
+    DB_POOL_MINSIZE: int = Field(default=1, ge=0)
+    DB_POOL_MAXSIZE: int = Field(default=10, ge=1)
+    DB_POOL_RECYCLE: int = 3600
+    DB_POOL_ACQUIRE_TIMEOUT: float = Field(default=5.0, gt=0)
+
+    # Clé de signature des jetons. Doit être partagée entre les workers,
+    # sinon les jetons émis par l'un seront refusés par les autres.
+    SECRET_KEY: str = Field(default_factory=lambda: secrets.token_urlsafe(32))
+    # Durées de vie des jetons, en secondes
+    ACCESS_TOKEN_TTL: int = 15 * 60
+    REFRESH_TOKEN_TTL: int = 7 * 24 * 60 * 60
+
+    # Pool dédié au hachage des mots de passe. Un pool de processus évite que
+    # le hachage, en Python pur, ne dispute le GIL à la boucle d'événements.
+    HASH_EXECUTOR: Literal["process", "thread"] = "process"
+    HASH_POOL_SIZE: int = Field(default_factory=lambda: min(4, os.cpu_count() or 1))
+
+    # Journal des requêtes : file bornée vidée par lots en tâche de fond
+    LOG_QUEUE_SIZE: int = 10_000
+    LOG_BATCH_SIZE: int = 500
+    LOG_FLUSH_INTERVAL: float = 1.0
+    # Chemins jamais journalisés, et proportion des autres requêtes conservées
+    LOG_EXCLUDED_PATHS: list[str] = ["/api/ping", "/api/ready"]
+    LOG_SAMPLE_RATE: float = Field(default=1.0, ge=0.0, le=1.0)
+    # Au-delà de cette durée, les entrées sont regroupées en statistiques horaires
+    LOG_RETENTION_DAYS: int = 7
+    LOG_COMPACTION_INTERVAL: float = 60 * 60
+
+    # Vérification périodique des soldes en attente maintenus sur les comptes
+    PENDING_RECONCILE_INTERVAL: float = 5 * 60
+
+    # Instantanés de solde : intervalle de la tâche de fond, nombre maximal de
+    # décisions entre deux instantanés d'un compte, taille des lots, et délai
+    # avant de reprendre une décision, le temps que les transactions plus
+    # anciennes soient validées
+    BALANCE_SNAPSHOT_INTERVAL: float = 60
+    BALANCE_SNAPSHOT_EVERY: int = Field(default=100, ge=1)
+    BALANCE_SNAPSHOT_BATCH_SIZE: int = Field(default=1000, ge=1)
+    BALANCE_SNAPSHOT_DELAY: float = Field(default=5.0, ge=0)
+
+    # Cache du statut de validation des comptes : durée de vie et taille
+    VALIDATION_CACHE_TTL: float = 60
+    VALIDATION_CACHE_SIZE: int = 10_000
+
+    # Limitation du débit, par préfixe de chemin et par client (utilisateur
+    # authentifié, ou adresse IP pour les autres requêtes)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMITS: dict[str, RateLimit] = {
+        "/api": RateLimit(rate=20, burst=50),
+        "/api/user": RateLimit(rate=5, burst=20),
+        "/api/logs": RateLimit(rate=2, burst=10),
+        "/api/auth": RateLimit(rate=1, burst=10),
+    }
+    RATE_LIMIT_EXCLUDED_PATHS: list[str] = ["/api/ping", "/api/ready", "/api/metrics"]
+    # Un seau inutilisé depuis ce délai est supprimé ; il doit dépasser le
+    # temps de remplissage du plus grand seau (`burst / rate`)
+    RATE_LIMIT_IDLE_TIMEOUT: float = 5 * 60
+    # Identifiants HTTP Basic vérifiés dont les requêtes sont comptées pour
+    # leur utilisateur (le frontend relaie ainsi ceux de tous ses clients)
+    BASIC_AUTH_CACHE_SIZE: int = 10_000
+    BASIC_AUTH_CACHE_TTL: float = 15 * 60
+
+    # Durée de conservation des réponses aux requêtes avec `Idempotency-Key`,
+    # nombre maximal de clés conservées, et intervalle de suppression de
+    # celles qui ont expiré
+    IDEMPOTENCY_TTL: float = 24 * 60 * 60
+    IDEMPOTENCY_MAX_KEYS: int = 100_000
+    IDEMPOTENCY_EXPIRY_INTERVAL: float = 60
+
+    # Durée du sommeil dont le réveil mesure le retard de la boucle d'événements
+    EVENT_LOOP_LAG_INTERVAL: float = 1.0
 
     model_config = SettingsConfigDict(
         env_file=".env",
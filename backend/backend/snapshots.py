@@ -0,0 +1,290 @@
+"""Instantanés de solde, et solde d'un compte à une date passée.
+
+Seules les décisions acceptées modifient le solde d'un compte. Une tâche de
+fond les reprend dans l'ordre de leurs identifiants, à partir de la plus
+grande décision déjà comptée dans `SoldeInstantane`, et tient à jour le
+dernier instantané de chaque compte concerné. Un nouvel instantané est
+commencé au premier jour d'activité qui suit le précédent, et après
+`BALANCE_SNAPSHOT_EVERY` décisions : entre deux instantanés, il y a donc au
+plus ce nombre de décisions, et l'historique n'est jamais relu.
+
+Le premier instantané d'un compte porte son solde à l'ouverture : le solde
+actuel moins l'effet de ses décisions acceptées, calculé une seule fois.
+
+Le solde à une date est celui du dernier instantané antérieur, plus l'effet
+des décisions acceptées qui le suivent jusqu'à cette date. Ces décisions
+sont cherchées parmi les opérations du compte créées depuis
+`debut_operations`, qui couvre aussi les débits encore en attente lors de
+l'écriture de l'instantané et validés ensuite.
+
+Les identifiants des décisions sont attribués avant la validation de leur
+transaction, pas forcément dans l'ordre : une décision n'est reprise
+qu'après `BALANCE_SNAPSHOT_DELAY` secondes, pour qu'aucune décision plus
+ancienne ne soit encore en cours.
+"""
+
+import typing
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from fastapi import HTTPException, status
+from tortoise import timezone
+from tortoise.expressions import Q
+from tortoise.functions import Max, Sum
+from tortoise.transactions import in_transaction
+
+from backend import metrics
+from backend.models import (
+    Compte,
+    Decision,
+    Operation,
+    SoldeInstantane,
+    TypeOperation,
+    balance_effect,
+)
+from backend.settings import settings
+
+SNAPSHOT_DECISIONS = metrics.counter(
+    "balance_snapshot_decisions_total",
+    "Décisions acceptées reportées dans les instantanés de solde.",
+)
+
+_DECISION_FIELDS = {
+    "id": "id",
+    "date_decision": "date_creation",
+    "type_operation": "operation__type_operation",
+    "compte_source_id": "operation__compte_source_id",
+    "compte_destination_id": "operation__compte_destination_id",
+    "montant": "operation__montant",
+    "date_operation": "operation__date_creation",
+}
+_EFFECT_FIELDS = ("type_operation", "compte_source_id", "montant")
+
+
+def _comptes(row: dict) -> typing.Iterator[int]:
+    for key in ("compte_source_id", "compte_destination_id"):
+        if row[key] is not None:
+            yield row[key]
+
+
+async def _latest(compte_ids: set[int]) -> dict[int, SoldeInstantane]:
+    """Dernier instantané de chaque compte, verrouillé jusqu'à la fin du lot."""
+    last_ids = (
+        await SoldeInstantane.filter(compte_id__in=compte_ids)
+        .annotate(last_id=Max("id"))
+        .group_by("compte_id")
+        .values_list("last_id", flat=True)
+    )
+    return {
+        snapshot.compte_id: snapshot
+        for snapshot in await SoldeInstantane.filter(
+            id__in=last_ids
+        ).select_for_update()
+    }
+
+
+async def _openings(compte_ids: set[int]) -> list[SoldeInstantane]:
+    """Instantanés d'ouverture des comptes qui n'en ont pas encore.
+
+    Le solde d'ouverture est le solde actuel moins l'effet de toutes les
+    décisions acceptées du compte.
+    """
+    debits = dict(
+        await Operation.filter(decision__valide=True, compte_source_id__in=compte_ids)
+        .annotate(total=Sum("montant"))
+        .group_by("compte_source_id")
+        .values_list("compte_source_id", "total")
+    )
+    effects: dict[int, Decimal] = defaultdict(Decimal, debits)
+    for compte_id, type_operation, total in (
+        await Operation.filter(
+            decision__valide=True, compte_destination_id__in=compte_ids
+        )
+        .annotate(total=Sum("montant"))
+        .group_by("compte_destination_id", "type_operation")
+        .values_list("compte_destination_id", "type_operation", "total")
+    ):
+        if type_operation == TypeOperation.VIREMENT:
+            effects[compte_id] -= total
+        else:
+            effects[compte_id] += total
+
+    return [
+        SoldeInstantane(
+            compte_id=compte_id,
+            decision_id=0,
+            solde=solde - effects[compte_id],
+            date_decision=date_creation,
+            decisions=0,
+            debut_operations=date_creation,
+        )
+        for compte_id, solde, date_creation in await Compte.filter(
+            id__in=compte_ids
+        ).values_list("id", "solde", "date_creation")
+    ]
+
+
+async def _oldest_undecided(
+    compte_ids: set[int], last_id: int, cutoff: datetime
+) -> dict[int, datetime]:
+    """Date de la plus ancienne opération de chaque compte sans décision reprise.
+
+    Ce sont les opérations en attente, et celles dont la décision est trop
+    récente pour être reprise dans ce lot.
+    """
+    pending = await Operation.filter(
+        Q(compte_source_id__in=compte_ids) | Q(compte_destination_id__in=compte_ids),
+        processed=False,
+    ).values("compte_source_id", "compte_destination_id", "date_creation")
+    recent = await Decision.filter(
+        id__gt=last_id, valide=True, date_creation__gte=cutoff
+    ).values(
+        compte_source_id="operation__compte_source_id",
+        compte_destination_id="operation__compte_destination_id",
+        date_creation="operation__date_creation",
+    )
+    oldest: dict[int, datetime] = {}
+    for row in (*pending, *recent):
+        for compte_id in _comptes(row):
+            if compte_id in compte_ids and (
+                compte_id not in oldest or row["date_creation"] < oldest[compte_id]
+            ):
+                oldest[compte_id] = row["date_creation"]
+    return oldest
+
+
+async def _apply_batch(after: int, cutoff: datetime, batch_size: int) -> list[int]:
+    """Reporte dans les instantanés un lot de décisions qui suivent `after`.
+
+    Retourne les identifiants des décisions du lot.
+    """
+    every = settings.BALANCE_SNAPSHOT_EVERY
+    async with in_transaction("default"):
+        rows = (
+            await Decision.filter(id__gt=after, valide=True, date_creation__lt=cutoff)
+            .order_by("id")
+            .limit(batch_size)
+            .values(**_DECISION_FIELDS)
+        )
+        if not rows:
+            return []
+
+        compte_ids = {compte_id for row in rows for compte_id in _comptes(row)}
+        latest = await _latest(compte_ids)
+        created = await _openings(compte_ids - latest.keys())
+        latest |= {snapshot.compte_id: snapshot for snapshot in created}
+        updated: dict[int, SoldeInstantane] = {}
+        # Décisions portant sur une opération plus ancienne que le dernier
+        # instantané : les instantanés précédents doivent couvrir sa date.
+        late: dict[int, tuple[int, datetime]] = {}
+
+        for row in rows:
+            for compte_id in _comptes(row):
+                snapshot = latest[compte_id]
+                if row["id"] <= snapshot.decision_id:
+                    # Déjà reportée par une exécution concurrente
+                    continue
+                if row["date_operation"] < snapshot.date_decision:
+                    _, oldest = late.get(compte_id, (0, row["date_operation"]))
+                    late[compte_id] = (row["id"], min(oldest, row["date_operation"]))
+                solde = snapshot.solde + balance_effect(compte_id, row)
+                if (
+                    snapshot.decisions == 0
+                    or snapshot.decisions >= every
+                    or snapshot.date_decision.date() != row["date_decision"].date()
+                ):
+                    snapshot = SoldeInstantane(compte_id=compte_id, decisions=0)
+                    created.append(snapshot)
+                    latest[compte_id] = snapshot
+                elif snapshot.pk is not None:
+                    updated[snapshot.pk] = snapshot
+                snapshot.solde = solde
+                snapshot.decision_id = row["id"]
+                snapshot.date_decision = row["date_decision"]
+                snapshot.debut_operations = row["date_decision"]
+                snapshot.decisions += 1
+
+        oldest = await _oldest_undecided(compte_ids, rows[-1]["id"], cutoff)
+        for snapshot in (*created, *updated.values()):
+            if snapshot.compte_id in oldest:
+                snapshot.debut_operations = min(
+                    snapshot.debut_operations, oldest[snapshot.compte_id]
+                )
+        await SoldeInstantane.bulk_create(created)
+        if updated:
+            await SoldeInstantane.bulk_update(
+                list(updated.values()),
+                fields=[
+                    "solde",
+                    "decision_id",
+                    "date_decision",
+                    "decisions",
+                    "debut_operations",
+                ],
+            )
+        for compte_id, (decision_id, date_operation) in late.items():
+            await SoldeInstantane.filter(
+                compte_id=compte_id,
+                decision_id__lt=decision_id,
+                debut_operations__gt=date_operation,
+            ).update(debut_operations=date_operation)
+
+    SNAPSHOT_DECISIONS.inc(len(rows))
+    return [row["id"] for row in rows]
+
+
+async def update_snapshots() -> int:
+    """Reporte dans les instantanés les décisions acceptées depuis la dernière
+    exécution, par lots de `BALANCE_SNAPSHOT_BATCH_SIZE`.
+
+    Chaque lot est appliqué dans sa propre transaction. Retourne le nombre de
+    décisions reprises.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.BALANCE_SNAPSHOT_DELAY)
+    row = (
+        await SoldeInstantane.annotate(last_id=Max("decision_id"))
+        .first()
+        .values("last_id")
+    )
+    # Aucun instantané : toutes les décisions sont à reprendre
+    after: int = row["last_id"] if row and row["last_id"] is not None else 0
+    total = 0
+    while ids := await _apply_batch(
+        after, cutoff, settings.BALANCE_SNAPSHOT_BATCH_SIZE
+    ):
+        total += len(ids)
+        after = ids[-1]
+    return total
+
+
+async def balance_at(compte: Compte, at: datetime) -> Decimal:
+    """Solde du compte à la date `at`, décisions de cette date comprises."""
+    accepted = Operation.filter(
+        Q(compte_source=compte) | Q(compte_destination=compte), decision__valide=True
+    )
+    snapshot = (
+        await SoldeInstantane.filter(compte=compte, date_decision__lte=at)
+        .order_by("-date_decision", "-decision_id")
+        .first()
+    )
+    if snapshot is not None:
+        rows = await accepted.filter(
+            date_creation__gte=snapshot.debut_operations,
+            decision__id__gt=snapshot.decision_id,
+            decision__date_creation__lte=at,
+        ).values(*_EFFECT_FIELDS)
+        return snapshot.solde + sum(
+            (balance_effect(compte.id, row) for row in rows), Decimal()
+        )
+
+    if await SoldeInstantane.exists(compte=compte):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Account did not exist at this date",
+        )
+    # Pas encore d'instantané : le solde actuel, moins les décisions suivantes
+    rows = await accepted.filter(decision__date_creation__gt=at).values(*_EFFECT_FIELDS)
+    return compte.solde - sum(
+        (balance_effect(compte.id, row) for row in rows), Decimal()
+    )
@@ -0,0 +1,92 @@
+"""Démarrage de l'application : préparation et état de disponibilité.
+
+Le démarrage (`lifespan`) se limite à ce qui est indispensable pour servir
+les requêtes. La préparation qui suit se fait en tâche de fond : ouverture
+des connexions du pool, démarrage des processus de hachage, construction
+des encodeurs de réponse et chargement des registres IBAN. `/api/ready` ne
+répond `200` qu'une fois la préparation terminée, et de nouveau `503` dès
+l'arrêt de l'application, alors que `/api/ping` indique seulement que le
+processus répond.
+
+Les durées d'import de l'application et de démarrage jusqu'à la fin de la
+préparation sont exposées par `/api/metrics`.
+"""
+
+import asyncio
+import logging
+import time
+
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+from tortoise import connections
+
+from backend import hashing, metrics, schemas
+from backend.migrations import pending
+from backend.models import random_iban
+
+logger = logging.getLogger(__name__)
+
+IMPORT_SECONDS = metrics.gauge(
+    "app_import_seconds", "Durée de l'import de l'application."
+)
+STARTUP_SECONDS = metrics.gauge(
+    "app_startup_seconds",
+    "Durée du démarrage, jusqu'à la fin de la préparation.",
+)
+READY = metrics.gauge("app_ready", "1 si l'application est prête à servir.")
+
+_ready = False
+
+
+def is_ready() -> bool:
+    return _ready
+
+
+def record_import(seconds: float) -> None:
+    IMPORT_SECONDS.set(seconds)
+    logger.info("Application importée en %.3f s", seconds)
+
+
+def set_ready(ready: bool) -> None:
+    global _ready
+    _ready = ready
+    READY.set(int(ready))
+
+
+async def check_migrations() -> None:
+    """Refuse de démarrer si des migrations n'ont pas été appliquées."""
+    migrations = await pending()
+    if migrations:
+        raise RuntimeError(
+            "Pending migrations: "
+            + ", ".join(migration.nom for migration in migrations)
+            + " (run `python -m backend.migrations upgrade`)"
+        )
+
+
+async def _open_connections() -> None:
+    # La première requête crée le pool, avec `DB_POOL_MINSIZE` connexions
+    for connection in connections.all():
+        await connection.execute_query("SELECT 1")
+
+
+def _build_encoders(app: FastAPI) -> None:
+    for route in app.routes:
+        if isinstance(route, APIRoute) and route.response_model is not None:
+            schemas.encoder(route.response_model)
+
+
+async def warm_up(app: FastAPI, started: float) -> None:
+    """Prépare l'application, puis la déclare prête."""
+    try:
+        await _open_connections()
+        await hashing.warm_up()
+        _build_encoders(app)
+        await asyncio.to_thread(random_iban)
+    except Exception:
+        logger.exception("Échec de la préparation de l'application")
+        raise
+    seconds = time.perf_counter() - started
+    STARTUP_SECONDS.set(seconds)
+    set_ready(True)
+    logger.info("Application prête en %.3f s", seconds)
@@ -0,0 +1,162 @@
+"""Relevé de compte exporté en flux (CSV ou NDJSON).
+
+Les opérations sont lues par tranches de `CHUNK_SIZE`, avec la même
+pagination par curseur que l'historique d'un compte : la mémoire utilisée ne
+dépend pas de la longueur de l'historique.
+
+Chaque ligne porte le solde après l'opération. Seules les opérations
+acceptées le modifient ; le solde d'ouverture est déduit du solde actuel du
+compte, moins l'effet des opérations acceptées depuis le début du relevé,
+ce qui tient compte du solde initial du compte.
+"""
+
+import csv
+import io
+import typing
+from datetime import datetime
+from decimal import Decimal
+
+import pydantic
+from tortoise.functions import Sum
+
+from backend.models import Compte, Operation, TypeOperation, balance_effect
+from backend.schemas import dump_json
+
+CHUNK_SIZE = 500
+CENTIME = Decimal("0.01")
+
+Statut = typing.Literal["acceptee", "refusee", "en_attente"]
+
+
+class LigneReleve(pydantic.BaseModel):
+    id: int
+    date_creation: datetime
+    type_operation: TypeOperation
+    statut: Statut
+    # Compte débité ou crédité en face de ce compte, s'il y en a un
+    compte_contrepartie: int | None
+    # Montant signé du point de vue de ce compte : négatif pour un débit
+    montant: Decimal
+    solde: Decimal
+
+
+COLUMNS = tuple(LigneReleve.model_fields)
+
+_FIELDS = (
+    "id",
+    "date_creation",
+    "type_operation",
+    "compte_source_id",
+    "compte_destination_id",
+    "processed",
+    "montant",
+    "decision__valide",
+)
+
+
+async def opening_balance(compte: Compte, debut: datetime | None) -> Decimal:
+    """Solde du compte avant la première opération à partir de `debut`."""
+    accepted = Operation.filter(decision__valide=True)
+    if debut:
+        accepted = accepted.filter(date_creation__gte=debut)
+
+    # Le regroupement explicite évite que la jointure sur `decision` ne
+    # fasse grouper la somme par opération.
+    debits = (
+        await accepted.filter(compte_source=compte)
+        .annotate(total=Sum("montant"))
+        .group_by("compte_source_id")
+        .values_list("total", flat=True)
+    )
+    credits = dict(
+        await accepted.filter(compte_destination=compte)
+        .annotate(total=Sum("montant"))
+        .group_by("type_operation")
+        .values_list("type_operation", "total")
+    )
+    effect = (
+        Decimal(debits[0] if debits else 0)
+        + Decimal(credits.get(TypeOperation.DEPOT, 0))
+        - Decimal(credits.get(TypeOperation.VIREMENT, 0))
+    )
+    return compte.solde - effect
+
+
+async def lines(
+    compte: Compte, debut: datetime | None = None, fin: datetime | None = None
+) -> typing.AsyncIterator[list[LigneReleve]]:
+    """Lignes du relevé, par tranches, dans l'ordre chronologique."""
+    solde = await opening_balance(compte, debut)
+    after = None
+    while True:
+        rows = await Operation.page_by_account(
+            compte, CHUNK_SIZE, after=after, debut=debut, fin=fin, ascending=True
+        ).values(*_FIELDS)
+        if not rows:
+            return
+        chunk = []
+        for row in rows:
+            montant = balance_effect(compte.id, row)
+            if row["decision__valide"]:
+                statut = "acceptee"
+                solde += montant
+            elif row["processed"]:
+                statut = "refusee"
+            else:
+                statut = "en_attente"
+            chunk.append(
+                LigneReleve.model_construct(
+                    id=row["id"],
+                    date_creation=row["date_creation"],
+                    type_operation=row["type_operation"],
+                    statut=statut,
+                    compte_contrepartie=(
+                        row["compte_destination_id"]
+                        if row["compte_source_id"] == compte.id
+                        else row["compte_source_id"]
+                    ),
+                    montant=montant.quantize(CENTIME),
+                    solde=solde.quantize(CENTIME),
+                )
+            )
+        yield chunk
+        if len(rows) < CHUNK_SIZE:
+            return
+        after = rows[-1]["date_creation"], rows[-1]["id"]
+
+
+async def csv_lines(
+    compte: Compte, debut: datetime | None = None, fin: datetime | None = None
+) -> typing.AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    async for chunk in lines(compte, debut, fin):
+        for line in chunk:
+            writer.writerow(
+                (
+                    line.id,
+                    line.date_creation.isoformat(),
+                    line.type_operation.value,
+                    line.statut,
+                    (
+                        ""
+                        if line.compte_contrepartie is None
+                        else line.compte_contrepartie
+                    ),
+                    line.montant,
+                    line.solde,
+                )
+            )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def ndjson_lines(
+    compte: Compte, debut: datetime | None = None, fin: datetime | None = None
+) -> typing.AsyncIterator[bytes]:
+    async for chunk in lines(compte, debut, fin):
+        yield b"".join(dump_json(LigneReleve, line) + b"\n" for line in chunk)
@@ -0,0 +1,44 @@
+"""Tâches exécutées en fond pendant la durée de vie de l'application."""
+
+import asyncio
+import logging
+import typing
+
+logger = logging.getLogger(__name__)
+
+_tasks: dict[str, asyncio.Task] = {}
+
+
+async def _repeat(
+    name: str, interval: float, function: typing.Callable[[], typing.Awaitable]
+) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await function()
+        except Exception:
+            logger.exception("Échec de la tâche périodique %s", name)
+
+
+def start(name: str, coroutine: typing.Coroutine[typing.Any, typing.Any, None]) -> None:
+    """Exécute `coroutine` en fond jusqu'à l'arrêt."""
+    if name in _tasks:
+        coroutine.close()
+        raise ValueError(f"Background task {name} already started")
+    _tasks[name] = asyncio.create_task(coroutine, name=name)
+
+
+def start_periodic(
+    name: str, interval: float, function: typing.Callable[[], typing.Awaitable]
+) -> None:
+    """Exécute `function` toutes les `interval` secondes jusqu'à l'arrêt."""
+    start(name, _repeat(name, interval, function))
+
+
+async def stop_all() -> None:
+    """Annule toutes les tâches périodiques et attend leur fin."""
+    tasks = list(_tasks.values())
+    _tasks.clear()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,113 @@
+import os
+
+# La configuration est lue à l'import de l'application : base SQLite en
+# mémoire, hachage dans un thread, et ni limitation de débit ni journal des
+# requêtes, dont les écritures en tâche de fond fausseraient les comptes.
+os.environ["DB_URL"] = "sqlite://:memory:"
+os.environ["HASH_EXECUTOR"] = "thread"
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ["LOG_SAMPLE_RATE"] = "0"
+
+import dataclasses  # noqa: E402
+import itertools  # noqa: E402
+import typing  # noqa: E402
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from backend import app  # noqa: E402
+
+PASSWORD = "motdepasse"
+
+_emails = itertools.count()
+
+
+@dataclasses.dataclass
+class Session:
+    email: str
+    access_token: str
+    refresh_token: str
+    account_id: int | None
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {"Authorization": f"Bearer {self.access_token}"}
+
+
+@pytest.fixture(scope="session")
+def client() -> typing.Iterator[TestClient]:
+    with TestClient(app) as client:
+        yield client
+
+
+def login(client: TestClient, email: str) -> tuple[str, str]:
+    response = client.post(
+        "/api/auth/token", json={"email": email, "mot_de_passe": PASSWORD}
+    )
+    assert response.status_code == 200, response.text
+    tokens = response.json()
+    return tokens["access_token"], tokens["refresh_token"]
+
+
+def create_user(client: TestClient, role: str = "utilisateur") -> Session:
+    """Crée un utilisateur (et son compte courant) puis ouvre une session."""
+    email = f"user{next(_emails)}@test.local"
+    response = client.post(
+        "/api/user",
+        json={"nom": email, "email": email, "mot_de_passe": PASSWORD, "role": role},
+    )
+    assert response.status_code == 200, response.text
+    account = response.json()["account"]
+    return Session(email, *login(client, email), account and account["id"])
+
+
+@pytest.fixture(scope="session")
+def agent(client: TestClient) -> Session:
+    return create_user(client, "agent_bancaire")
+
+
+@pytest.fixture(scope="session")
+def target(client: TestClient) -> Session:
+    """Destinataire des virements du client de test."""
+    return create_user(client)
+
+
+@pytest.fixture(scope="session")
+def user(client: TestClient, target: Session) -> Session:
+    """Client approvisionné, avec quelques opérations sur son compte courant."""
+    session = create_user(client)
+    transaction = f"/api/transaction/{session.account_id}"
+    for _ in range(3):
+        for operation, payload in (
+            ("depot", {"montant": 100}),
+            ("retrait", {"montant": 5}),
+            ("virement", {"montant": 5, "target": target.account_id}),
+        ):
+            response = client.post(
+                f"{transaction}/{operation}", json=payload, headers=session.headers
+            )
+            assert response.status_code == 200, response.text
+    return session
+
+
+@pytest.fixture(scope="session")
+def pending_account(client: TestClient) -> int:
+    """Livret d'un autre client, en attente de validation."""
+    session = create_user(client)
+    response = client.post(
+        "/api/account", json={"type": "livret"}, headers=session.headers
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+@pytest.fixture
+def pending_operation(client: TestClient, user: Session) -> int:
+    """Retrait en attente de validation, propre au test."""
+    response = client.post(
+        f"/api/transaction/{user.account_id}/retrait",
+        json={"montant": 1},
+        headers=user.headers,
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
@@ -0,0 +1,77 @@
+"""Enregistrement des requêtes SQL émises pendant un appel à l'API.
+
+Tortoise journalise chaque requête exécutée sur le logger
+`tortoise.db_client`, au niveau DEBUG : `record_queries` y branche un
+handler le temps d'un bloc, sans toucher aux clients de base de données.
+
+Deux requêtes ont la même forme quand elles ne diffèrent que par leurs
+valeurs littérales et la longueur de leurs listes `IN (...)` : une même
+forme répétée dans une seule requête HTTP signale le plus souvent une
+boucle de requêtes (N+1).
+"""
+
+import collections
+import contextlib
+import logging
+import re
+import typing
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDERS = re.compile(r"\((?:\s*(?:\?|%s|\$\d+)\s*,)*\s*(?:\?|%s|\$\d+)\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def shape(sql: str) -> str:
+    """Forme normalisée d'une requête, sans ses valeurs."""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PLACEHOLDERS.sub("(...)", sql)
+    return _SPACES.sub(" ", sql).strip()
+
+
+class QueryLog(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.statements: list[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # Les clients journalisent `"%s: %s", requête, valeurs`, ou la requête
+        # seule pour les scripts
+        sql = (
+            record.args[0]
+            if isinstance(record.args, tuple) and record.args
+            else record.msg
+        )
+        self.statements.append(str(sql))
+
+    def __len__(self) -> int:
+        return len(self.statements)
+
+    def repeated(self, max_repeats: int = 1) -> dict[str, int]:
+        """Formes exécutées plus de `max_repeats` fois, avec leur nombre."""
+        counts = collections.Counter(shape(sql) for sql in self.statements)
+        return {sql: count for sql, count in counts.items() if count > max_repeats}
+
+    def report(self) -> str:
+        return "\n".join(f"  {index}. {sql}" for index, sql in enumerate(self, 1))
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(self.statements)
+
+
+@contextlib.contextmanager
+def record_queries() -> typing.Iterator[QueryLog]:
+    """Enregistre les requêtes SQL exécutées pendant le bloc."""
+    logger = logging.getLogger("tortoise.db_client")
+    handler = QueryLog()
+    level, propagate = logger.level, logger.propagate
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    try:
+        yield handler
+    finally:
+        logger.setLevel(level)
+        logger.propagate = propagate
+        logger.removeHandler(handler)
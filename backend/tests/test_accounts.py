@@ -0,0 +1,76 @@
+"""Validation des comptes par un agent."""
+
+import pytest
+from fastapi.testclient import TestClient
+from tests.conftest import Session, create_user
+
+
+@pytest.mark.parametrize(
+    "decisions, expected",
+    [((False, True), 200), ((True, False), 403)],
+    ids=["refuse-puis-valide", "valide-puis-refuse"],
+)
+def test_latest_validation_applies(
+    client: TestClient, agent: Session, decisions: tuple[bool, ...], expected: int
+):
+    session = create_user(client)
+    response = client.post(
+        "/api/account", json={"type": "livret"}, headers=session.headers
+    )
+    assert response.status_code == 200, response.text
+    account_id = response.json()["id"]
+    for authorize in decisions:
+        response = client.post(
+            f"/api/account/{account_id}/approval",
+            json={"authorize": authorize},
+            headers=agent.headers,
+        )
+        assert response.status_code == 204, response.text
+
+    response = client.post(
+        f"/api/transaction/{account_id}/depot",
+        json={"montant": 10},
+        headers=session.headers,
+    )
+    assert response.status_code == expected, response.text
+
+    response = client.get("/api/account", headers=session.headers)
+    assert response.status_code == 200, response.text
+    (listed,) = [row for row in response.json() if row["account"]["id"] == account_id]
+    assert listed["validation"]["valide"] is decisions[-1]
+
+    # Le détail du compte n'échoue pas sur ses validations successives
+    response = client.get(f"/api/account/{account_id}", headers=session.headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["validation"]["valide"] is decisions[-1]
+
+
+def test_operations_are_paged_by_cursor(client: TestClient):
+    session = create_user(client)
+    for montant in range(1, 6):
+        response = client.post(
+            f"/api/transaction/{session.account_id}/depot",
+            json={"montant": montant},
+            headers=session.headers,
+        )
+        assert response.status_code == 200, response.text
+
+    pages: list[list[int]] = []
+    params: dict[str, str | int] = {"limit": 2}
+    while True:
+        response = client.get(
+            f"/api/account/{session.account_id}",
+            params=params,
+            headers=session.headers,
+        )
+        assert response.status_code == 200, response.text
+        body = response.json()
+        pages.append([operation["id"] for operation in body["operations"]])
+        if body["next_cursor"] is None:
+            break
+        params = {"limit": 2, "cursor": body["next_cursor"]}
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    ids = [id for page in pages for id in page]
+    assert ids == sorted(ids, reverse=True)
+    assert len(set(ids)) == 5
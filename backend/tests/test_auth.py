@@ -0,0 +1,17 @@
+"""Jetons d'accès malformés."""
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.mark.parametrize(
+    "token",
+    ["é.signature", "payload.é", "ÿþ"],
+    ids=["payload", "signature", "sans-point"],
+)
+def test_non_ascii_token_is_rejected(client: TestClient, token: str):
+    # Les en-têtes sont transmis en octets, et décodés en latin-1 par le serveur
+    response = client.get(
+        "/api/user/me", headers={b"Authorization": f"Bearer {token}".encode()}
+    )
+    assert response.status_code == 401, response.text
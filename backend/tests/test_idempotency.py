@@ -0,0 +1,78 @@
+"""Rejeu des requêtes portant l'en-tête `Idempotency-Key`."""
+
+import asyncio
+
+from fastapi.testclient import TestClient
+from tests.conftest import create_user
+
+from backend.idempotency import IdempotencyStore
+
+
+def test_replay_checks_credentials(client: TestClient):
+    session = create_user(client)
+    deposit = f"/api/transaction/{session.account_id}/depot"
+    headers = session.headers | {"Idempotency-Key": "depot-revoque"}
+
+    response = client.post(deposit, json={"montant": 10}, headers=headers)
+    assert response.status_code == 200, response.text
+    replayed = client.post(deposit, json={"montant": 10}, headers=headers)
+    assert replayed.headers["Idempotent-Replayed"] == "true"
+    assert replayed.json() == response.json()
+
+    response = client.post("/api/auth/logout", headers=session.headers)
+    assert response.status_code == 204, response.text
+    response = client.post(deposit, json={"montant": 10}, headers=headers)
+    assert response.status_code == 401, response.text
+
+
+def test_replay_survives_a_token_refresh(client: TestClient):
+    session = create_user(client)
+    deposit = f"/api/transaction/{session.account_id}/depot"
+    key = {"Idempotency-Key": "depot-renouvele"}
+
+    response = client.post(deposit, json={"montant": 10}, headers=session.headers | key)
+    assert response.status_code == 200, response.text
+
+    refreshed = client.post(
+        "/api/auth/refresh", json={"refresh_token": session.refresh_token}
+    )
+    assert refreshed.status_code == 200, refreshed.text
+    headers = {"Authorization": f"Bearer {refreshed.json()['access_token']}"}
+    assert headers != session.headers
+    replayed = client.post(deposit, json={"montant": 10}, headers=headers | key)
+    assert replayed.headers["Idempotent-Replayed"] == "true"
+    assert replayed.json() == response.json()
+
+    # Un autre utilisateur avec la même clé exécute sa propre requête
+    other = create_user(client)
+    response = client.post(
+        f"/api/transaction/{other.account_id}/depot",
+        json={"montant": 10},
+        headers=other.headers | key,
+    )
+    assert response.status_code == 200, response.text
+    assert "Idempotent-Replayed" not in response.headers
+
+
+def test_query_string_is_part_of_the_request(client: TestClient):
+    session = create_user(client)
+    deposit = f"/api/transaction/{session.account_id}/depot"
+    headers = session.headers | {"Idempotency-Key": "depot-requete"}
+
+    response = client.post(deposit, json={"montant": 10}, headers=headers)
+    assert response.status_code == 200, response.text
+    response = client.post(f"{deposit}?autre=1", json={"montant": 10}, headers=headers)
+    assert response.status_code == 422, response.text
+
+
+def test_store_forgets_oldest_responses():
+    async def fill() -> IdempotencyStore:
+        store = IdempotencyStore(ttl=60, maxsize=2)
+        pending = store.claim("en-cours", "")
+        for key in ("a", "b", "c"):
+            store.claim(key, "").response.set_result(None)
+        assert not pending.response.done()
+        return store
+
+    store = asyncio.run(fill())
+    assert list(store.entries) == ["en-cours", "c"]
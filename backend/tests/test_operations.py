@@ -0,0 +1,73 @@
+"""Validation des opérations par un agent."""
+
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+from tests.conftest import Session, create_user
+
+
+def balances(client: TestClient, session: Session) -> tuple[Decimal, Decimal]:
+    """Solde et total des débits en attente du compte courant."""
+    response = client.get(f"/api/account/{session.account_id}", headers=session.headers)
+    assert response.status_code == 200, response.text
+    account = response.json()["account"]
+    return Decimal(account["solde"]), Decimal(account["solde_en_attente"])
+
+
+def test_validate_mixed_operations(client: TestClient, agent: Session):
+    session, other = create_user(client), create_user(client)
+    transaction = f"/api/transaction/{session.account_id}"
+    response = client.post(
+        f"{transaction}/depot", json={"montant": 100}, headers=session.headers
+    )
+    assert response.status_code == 200, response.text
+
+    created = {}
+    for name, operation, payload in (
+        ("traite", "retrait", {"montant": 5}),
+        ("retrait", "retrait", {"montant": 30}),
+        ("virement", "virement", {"montant": 20, "target": other.account_id}),
+        ("refuse", "retrait", {"montant": 10}),
+    ):
+        response = client.post(
+            f"{transaction}/{operation}", json=payload, headers=session.headers
+        )
+        assert response.status_code == 200, response.text
+        created[name] = response.json()["id"]
+
+    response = client.post(
+        f"/api/transaction/validate/{created['traite']}",
+        json={"authorize": True},
+        headers=agent.headers,
+    )
+    assert response.status_code == 200, response.text
+    assert balances(client, session) == (95, 60)
+
+    unknown = max(created.values()) + 1000
+    response = client.post(
+        "/api/transaction/validate",
+        json={
+            "decisions": [
+                {"id": created["retrait"], "authorize": True},
+                {"id": created["traite"], "authorize": True},
+                {"id": unknown, "authorize": True},
+                {"id": created["virement"], "authorize": True},
+                {"id": created["refuse"], "authorize": False},
+                {"id": created["retrait"], "authorize": True},
+            ]
+        },
+        headers=agent.headers,
+    )
+    assert response.status_code == 200, response.text
+    assert [(result["id"], result["status"]) for result in response.json()] == [
+        (created["retrait"], "applied"),
+        (created["traite"], "skipped"),
+        (unknown, "not_found"),
+        (created["virement"], "applied"),
+        (created["refuse"], "applied"),
+        (created["retrait"], "skipped"),
+    ]
+
+    # Le retrait déjà traité n'est pas débité une seconde fois
+    assert balances(client, session) == (45, 0)
+    assert balances(client, other) == (20, 0)
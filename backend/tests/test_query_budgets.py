@@ -0,0 +1,211 @@
+"""Budget de requêtes SQL de chaque route.
+
+Chaque route déclarée dans `BUDGETS` est appelée une fois ; le test échoue
+si elle exécute plus de requêtes SQL que son budget, ou si une même forme de
+requête est répétée plus de `repeats` fois (N+1). Une route ajoutée à
+l'application sans budget fait aussi échouer `test_every_route_has_a_budget`.
+"""
+
+import dataclasses
+import itertools
+import typing
+
+import pytest
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+from tests.conftest import Session, create_user, login
+from tests.queries import record_queries
+
+from backend import app
+from backend.models import validation_cache
+
+Params = dict[str, typing.Any]
+
+_emails = itertools.count()
+
+
+@dataclasses.dataclass(frozen=True)
+class Budget:
+    method: str
+    path: str
+    # Nombre maximal de requêtes SQL
+    queries: int
+    # Nombre maximal d'exécutions d'une même forme de requête
+    repeats: int = 1
+    # Session utilisée : le client de test, l'agent, une nouvelle session du
+    # client (révocable), un nouvel utilisateur (supprimable) ou aucune
+    auth: typing.Literal["user", "agent", "fresh", "new_user"] | None = "user"
+    json: typing.Callable[[Params], typing.Any] | None = None
+    # Paramètres du chemin pris sous un autre nom dans `params`
+    rename: dict[str, str] = dataclasses.field(default_factory=dict)
+    status: int = 200
+
+    def __str__(self) -> str:
+        return f"{self.method} {self.path}"
+
+
+BUDGETS = [
+    Budget(
+        "POST",
+        "/api/auth/token",
+        1,
+        auth=None,
+        json=lambda p: {"email": p["email"], "mot_de_passe": "motdepasse"},
+    ),
+    Budget(
+        "POST",
+        "/api/auth/refresh",
+        1,
+        auth="fresh",
+        json=lambda p: {"refresh_token": p["refresh_token"]},
+    ),
+    Budget("POST", "/api/auth/logout", 0, auth="fresh", status=204),
+    Budget("GET", "/api/user", 1),
+    Budget(
+        "POST",
+        "/api/user",
+        3,
+        auth=None,
+        json=lambda p: {
+            "nom": "nouveau",
+            "email": f"budget{next(_emails)}@test.local",
+            "mot_de_passe": "motdepasse",
+            "role": "utilisateur",
+        },
+    ),
+    Budget("GET", "/api/user/me", 0),
+    Budget("GET", "/api/user/me/recent", 1),
+    Budget("DELETE", "/api/user/me", 1, auth="new_user", status=204),
+    Budget("GET", "/api/account", 1),
+    Budget("GET", "/api/account/tovalidate", 1, auth="agent"),
+    Budget("POST", "/api/account", 1, json=lambda p: {"type": "livret"}),
+    Budget("GET", "/api/account/{account_id}", 3),
+    Budget("GET", "/api/account/{account_id}/statement", 4),
+    Budget("GET", "/api/account/{account_id}/balance", 4),
+    Budget(
+        "POST",
+        "/api/account/{account_id}/approval",
+        2,
+        auth="agent",
+        json=lambda p: {"authorize": True},
+        rename={"account_id": "pending_account"},
+        status=204,
+    ),
+    Budget("DELETE", "/api/account/me", 1, auth="new_user", status=204),
+    Budget(
+        "POST",
+        "/api/transaction/{account_id}/depot",
+        6,
+        json=lambda p: {"montant": 10},
+    ),
+    Budget(
+        "POST",
+        "/api/transaction/{account_id}/retrait",
+        5,
+        json=lambda p: {"montant": 1},
+    ),
+    Budget(
+        "POST",
+        "/api/transaction/{account_id}/virement",
+        7,
+        json=lambda p: {"montant": 1, "target": p["target"]},
+        # Validation des comptes source et destination
+        repeats=2,
+    ),
+    Budget(
+        "POST",
+        "/api/transaction/{account_id}/virements",
+        8,
+        json=lambda p: {
+            "virements": [
+                {"montant": 1, "target": p["target"]},
+                {"montant": 2, "target": p["target"]},
+                {"montant": 3, "target": 0},
+            ]
+        },
+    ),
+    Budget("GET", "/api/transaction/tovalidate", 1, auth="agent"),
+    Budget(
+        "POST",
+        "/api/transaction/validate/{id}",
+        6,
+        auth="agent",
+        json=lambda p: {"authorize": True},
+    ),
+    Budget(
+        "POST",
+        "/api/transaction/validate",
+        5,
+        auth="agent",
+        json=lambda p: {"decisions": [{"id": p["id"], "authorize": True}]},
+    ),
+    Budget("GET", "/api/ping", 0, auth=None),
+    Budget("GET", "/api/ready", 0, auth=None),
+    Budget("GET", "/api/metrics", 0, auth=None),
+    Budget("GET", "/api/logs", 1, auth=None),
+    Budget("GET", "/api/logs/stats", 1, auth=None),
+]
+
+
+def test_every_route_has_a_budget():
+    budgeted = {(budget.method, budget.path) for budget in BUDGETS}
+    routes = {
+        (method, route.path)
+        for route in app.routes
+        if isinstance(route, APIRoute)
+        for method in route.methods
+    }
+    assert routes - budgeted == set()
+
+
+@pytest.mark.parametrize("budget", BUDGETS, ids=str)
+def test_query_budget(
+    client: TestClient,
+    user: Session,
+    agent: Session,
+    target: Session,
+    pending_account: int,
+    pending_operation: int,
+    budget: Budget,
+):
+    sessions: dict[str | None, Session | typing.Callable[[], Session] | None] = {
+        "user": user,
+        "agent": agent,
+        "fresh": lambda: Session(user.email, *login(client, user.email), None),
+        "new_user": lambda: create_user(client),
+        None: None,
+    }
+    session = sessions[budget.auth]
+    if callable(session):
+        session = session()
+    params = {
+        "account_id": user.account_id,
+        "id": pending_operation,
+        "pending_account": pending_account,
+        "email": user.email,
+        "target": target.account_id,
+        "refresh_token": session.refresh_token if session else None,
+    }
+
+    # Les comptes sont mesurés cache vide, dans le pire cas
+    validation_cache.clear()
+
+    with record_queries() as queries:
+        response = client.request(
+            budget.method,
+            budget.path.format_map(
+                params | {name: params[key] for name, key in budget.rename.items()}
+            ),
+            json=budget.json(params) if budget.json else None,
+            headers=session.headers if session else None,
+        )
+
+    assert response.status_code == budget.status, response.text
+    assert len(queries) <= budget.queries, (
+        f"{budget} a exécuté {len(queries)} requêtes SQL pour un budget de "
+        f"{budget.queries} :\n{queries.report()}"
+    )
+    repeated = queries.repeated(budget.repeats)
+    assert not repeated, f"{budget} répète des requêtes (N+1) :\n" + "\n".join(
+        f"  {count} x {sql}" for sql, count in repeated.items()
+    )
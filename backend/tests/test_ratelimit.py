@@ -0,0 +1,110 @@
+"""Limitation du débit, et client auquel une requête est attribuée."""
+
+import asyncio
+import base64
+
+import pytest
+from fastapi import Request
+from fastapi.testclient import TestClient
+from tests.conftest import PASSWORD, create_user
+
+from backend import ratelimit
+from backend.ratelimit import MemoryBackend, RateLimiter, client_identity
+from backend.settings import RateLimit, settings
+
+
+def request(authorization: str | None = None, host: str = "192.0.2.1") -> Request:
+    headers = [(b"authorization", authorization.encode())] if authorization else []
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/api/user/me",
+            "query_string": b"",
+            "headers": headers,
+            "client": (host, 50000),
+        }
+    )
+
+
+def basic(username: str, password: str = "secret") -> str:
+    return "Basic " + base64.b64encode(f"{username}:{password}".encode()).decode()
+
+
+@pytest.fixture
+def limited(monkeypatch: pytest.MonkeyPatch):
+    """Active la limitation, avec 3 requêtes au plus par client sous `/api`."""
+
+    def enable(rate: float = 0.001, burst: int = 3) -> None:
+        monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+        monkeypatch.setattr(
+            ratelimit,
+            "limiter",
+            RateLimiter(
+                MemoryBackend(idle_timeout=60),
+                {"/api": RateLimit(rate=rate, burst=burst)},
+            ),
+        )
+
+    return enable
+
+
+def test_rotating_basic_usernames_share_the_ip_bucket():
+    limiter = RateLimiter(
+        MemoryBackend(idle_timeout=60), {"/api": RateLimit(rate=0.001, burst=3)}
+    )
+
+    async def check(usernames: list[str]) -> list[float]:
+        return [await limiter.check(request(basic(name))) for name in usernames]
+
+    retry_after = asyncio.run(check([f"user{index}@test.local" for index in range(4)]))
+    assert retry_after[:3] == [0, 0, 0]
+    assert retry_after[3] > 0
+
+
+def test_only_verified_credentials_get_a_user_bucket(client: TestClient):
+    session = create_user(client)
+    ip = ("ip", "192.0.2.1")
+    assert client_identity(request(basic(session.email, PASSWORD))) == ip
+
+    response = client.get("/api/user/me", auth=(session.email, PASSWORD))
+    assert response.status_code == 200, response.text
+    user = ("user", str(response.json()["id"]))
+
+    assert client_identity(request(f"Bearer {session.access_token}")) == user
+    assert client_identity(request(f"Bearer {session.access_token}x")) == ip
+    assert client_identity(request(basic(session.email, PASSWORD))) == user
+    assert client_identity(request(basic(session.email))) == ip
+
+
+def test_basic_users_behind_one_address_have_their_own_bucket(
+    client: TestClient, limited
+):
+    first, second = create_user(client), create_user(client)
+    limited()
+
+    # Première requête de chacun, comptée pour l'adresse IP du frontend
+    for session in (first, second):
+        response = client.get("/api/user/me", auth=(session.email, PASSWORD))
+        assert response.status_code == 200, response.text
+
+    for _ in range(3):
+        response = client.get("/api/user/me", auth=(first.email, PASSWORD))
+        assert response.status_code == 200, response.text
+    response = client.get("/api/user/me", auth=(first.email, PASSWORD))
+    assert response.status_code == 429, response.text
+
+    for _ in range(3):
+        response = client.get("/api/user/me", auth=(second.email, PASSWORD))
+        assert response.status_code == 200, response.text
+
+
+def test_empty_bucket_is_refused_with_retry_after(client: TestClient, limited):
+    limited(rate=0.5, burst=1)
+
+    assert client.get("/api/logs").status_code == 200
+    response = client.get("/api/logs")
+    assert response.status_code == 429
+    assert response.json() == {"detail": "Too many requests"}
+    # Un jeton toutes les 2 secondes
+    assert response.headers["Retry-After"] == "2"
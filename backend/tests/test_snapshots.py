@@ -0,0 +1,118 @@
+"""Instantanés de solde, comparés aux opérations du compte."""
+
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from anyio.from_thread import BlockingPortal
+from fastapi.testclient import TestClient
+from tests.conftest import Session, create_user
+from tortoise import timezone
+from tortoise.expressions import Q
+
+from backend import snapshots
+from backend.models import Compte, Operation, SoldeInstantane, balance_effect
+from backend.settings import settings
+
+
+async def recomputed(compte_id: int, at: datetime) -> Decimal:
+    """Solde à la date `at`, recalculé depuis toutes les opérations du compte."""
+    rows = await Operation.filter(
+        Q(compte_source_id=compte_id) | Q(compte_destination_id=compte_id),
+        decision__valide=True,
+        decision__date_creation__lte=at,
+    ).values("type_operation", "compte_source_id", "montant")
+    return sum((balance_effect(compte_id, row) for row in rows), Decimal())
+
+
+async def balance_at(compte_id: int, at: datetime) -> Decimal:
+    return await snapshots.balance_at(await Compte.get(id=compte_id), at)
+
+
+async def snapshot_rows() -> list[tuple]:
+    return (
+        await SoldeInstantane.all()
+        .order_by("id")
+        .values_list(
+            "id",
+            "compte_id",
+            "decision_id",
+            "solde",
+            "decisions",
+            "date_decision",
+            "debut_operations",
+        )
+    )
+
+
+@pytest.fixture
+def portal(client: TestClient) -> BlockingPortal:
+    """Boucle de l'application, pour appeler les fonctions asynchrones."""
+    assert client.portal is not None
+    return client.portal
+
+
+@pytest.fixture
+def every_two_decisions(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "BALANCE_SNAPSHOT_EVERY", 2)
+    monkeypatch.setattr(settings, "BALANCE_SNAPSHOT_DELAY", 0)
+
+
+def test_balance_at_matches_the_operations(
+    client: TestClient, portal: BlockingPortal, agent: Session, every_two_decisions
+):
+    session, other = create_user(client), create_user(client)
+    compte_id = session.account_id
+    assert compte_id is not None
+    moments: list[datetime] = []
+
+    def run(kind: str, authorize: bool | None = None, **payload) -> None:
+        response = client.post(
+            f"/api/transaction/{session.account_id}/{kind}",
+            json=payload,
+            headers=session.headers,
+        )
+        assert response.status_code == 200, response.text
+        if authorize is not None:
+            response = client.post(
+                f"/api/transaction/validate/{response.json()['id']}",
+                json={"authorize": authorize},
+                headers=agent.headers,
+            )
+            assert response.status_code == 200, response.text
+        moments.append(timezone.now())
+
+    def check() -> None:
+        for at in moments:
+            expected = portal.call(recomputed, compte_id, at)
+            assert portal.call(balance_at, compte_id, at) == expected
+
+    run("depot", montant=100)
+    run("retrait", True, montant=30)
+    run("virement", True, montant=10, target=other.account_id)
+    run("retrait", False, montant=5)
+    run("depot", montant=20)
+    # Avant le premier instantané du compte
+    assert not portal.call(SoldeInstantane.filter(compte_id=compte_id).exists)
+    check()
+
+    assert portal.call(snapshots.update_snapshots) > 0
+    assert portal.call(SoldeInstantane.filter(compte_id=compte_id).count)
+    check()
+
+    run("retrait", True, montant=4)
+    run("depot", montant=7)
+    check()
+    # 100 - 30 - 10 + 20 - 4 + 7
+    assert portal.call(balance_at, compte_id, moments[-1]) == 83
+
+
+def test_update_snapshots_is_idempotent(
+    portal: BlockingPortal, user: Session, every_two_decisions
+):
+    portal.call(snapshots.update_snapshots)
+    rows = portal.call(snapshot_rows)
+    assert rows
+
+    assert portal.call(snapshots.update_snapshots) == 0
+    assert portal.call(snapshot_rows) == rows
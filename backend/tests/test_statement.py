@@ -0,0 +1,80 @@
+"""Relevé de compte : solde d'ouverture et solde après chaque opération."""
+
+import json
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+from tests.conftest import Session, create_user
+
+
+def operation(client: TestClient, session: Session, kind: str, **payload) -> dict:
+    response = client.post(
+        f"/api/transaction/{session.account_id}/{kind}",
+        json=payload,
+        headers=session.headers,
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def decide(client: TestClient, agent: Session, created: dict, authorize: bool) -> None:
+    response = client.post(
+        f"/api/transaction/validate/{created['id']}",
+        json={"authorize": authorize},
+        headers=agent.headers,
+    )
+    assert response.status_code == 200, response.text
+
+
+def test_statement_balances(client: TestClient, agent: Session):
+    session, other = create_user(client), create_user(client)
+
+    # Avant le début du relevé : solde d'ouverture de 100 - 30 - 20 + 15
+    operation(client, session, "depot", montant=100)
+    decide(client, agent, operation(client, session, "retrait", montant=30), True)
+    sent = operation(client, session, "virement", montant=20, target=other.account_id)
+    decide(client, agent, sent, True)
+    operation(client, other, "depot", montant=50)
+    received = operation(
+        client, other, "virement", montant=15, target=session.account_id
+    )
+    decide(client, agent, received, True)
+    decide(client, agent, operation(client, session, "retrait", montant=5), False)
+
+    first = operation(client, session, "depot", montant=40)
+    decide(client, agent, operation(client, session, "retrait", montant=10), True)
+    received = operation(
+        client, other, "virement", montant=7, target=session.account_id
+    )
+    decide(client, agent, received, True)
+    operation(client, session, "virement", montant=12, target=other.account_id)
+    decide(client, agent, operation(client, session, "retrait", montant=3), False)
+
+    response = client.get(
+        f"/api/account/{session.account_id}/statement",
+        params={"format": "ndjson", "from": first["date_creation"]},
+        headers=session.headers,
+    )
+    assert response.status_code == 200, response.text
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [
+        (line["type_operation"], line["statut"], line["montant"], line["solde"])
+        for line in lines
+    ] == [
+        ("depot", "acceptee", "40.00", "105.00"),
+        ("retrait", "acceptee", "-10.00", "95.00"),
+        ("virement", "acceptee", "7.00", "102.00"),
+        ("virement", "en_attente", "-12.00", "102.00"),
+        ("retrait", "refusee", "-3.00", "102.00"),
+    ]
+    assert [line["compte_contrepartie"] for line in lines] == [
+        None,
+        None,
+        other.account_id,
+        other.account_id,
+        None,
+    ]
+
+    response = client.get(f"/api/account/{session.account_id}", headers=session.headers)
+    assert response.status_code == 200, response.text
+    assert Decimal(lines[-1]["solde"]) == Decimal(response.json()["account"]["solde"])
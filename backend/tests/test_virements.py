@@ -0,0 +1,61 @@
+"""Virements par lot, en JSON ou en flux NDJSON."""
+
+import json
+import typing
+
+import pytest
+from fastapi.testclient import TestClient
+from tests.conftest import Session
+from tests.queries import record_queries
+
+from backend.routes import transaction
+
+NDJSON = {"Content-Type": "application/x-ndjson"}
+
+
+def ndjson(target: int, count: int) -> typing.Iterator[bytes]:
+    """Flux NDJSON de `count` virements, découpé au milieu des lignes."""
+    body = "".join(
+        json.dumps({"target": target, "montant": 1}) + "\n" for _ in range(count)
+    ).encode()
+    for start in range(0, len(body), 7):
+        yield body[start : start + 7]
+
+
+def test_ndjson_is_processed_by_chunk(
+    client: TestClient, user: Session, target: Session, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(transaction, "NDJSON_CHUNK_SIZE", 2)
+    assert target.account_id is not None
+
+    with record_queries() as queries:
+        response = client.post(
+            f"/api/transaction/{user.account_id}/virements",
+            content=ndjson(target.account_id, 5),
+            headers=user.headers | NDJSON,
+        )
+
+    assert response.status_code == 200, response.text
+    assert [result["index"] for result in response.json()] == list(range(5))
+    assert {result["status"] for result in response.json()} == {"created"}
+    statements = list(queries)
+    # Les comptes destinataires de chaque lot lu, puis une seule insertion
+    assert (
+        sum('FROM "compte"' in sql and "LEFT OUTER JOIN" in sql for sql in statements)
+        == 3
+    )
+    assert sum(sql.startswith('INSERT INTO "operation"') for sql in statements) == 1
+
+
+def test_ndjson_is_replayed_with_its_idempotency_key(
+    client: TestClient, user: Session, target: Session
+):
+    assert target.account_id is not None
+    path = f"/api/transaction/{user.account_id}/virements"
+    headers = user.headers | NDJSON | {"Idempotency-Key": "paie-ndjson"}
+
+    response = client.post(path, content=ndjson(target.account_id, 2), headers=headers)
+    assert response.status_code == 200, response.text
+    replayed = client.post(path, content=ndjson(target.account_id, 2), headers=headers)
+    assert replayed.headers["Idempotent-Replayed"] == "true"
+    assert replayed.json() == response.json()